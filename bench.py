@@ -0,0 +1,130 @@
+"""Microbenchmarks for Cord Titan's hot paths
+
+Run with: python bench.py
+"""
+
+import audioop
+import random
+import time
+import timeit
+from collections import deque
+
+import bot
+from bot import IndexedQueue
+
+
+def bench_queue(size=5000, rounds=2000):
+    """Old deque-based MusicQueue operations against IndexedQueue"""
+    rng = random.Random(0)
+    old = deque(range(size))
+    new = IndexedQueue(range(size))
+    
+    def old_remove():
+        index = rng.randrange(len(old))
+        removed = list(old)[index]
+        del old[index]
+        old.append(removed)
+    
+    def new_remove():
+        new.append(new.pop(rng.randrange(len(new))))
+    
+    def old_move():
+        queue_list = list(old)
+        song = queue_list.pop(rng.randrange(size))
+        queue_list.insert(rng.randrange(size), song)
+        old.clear()
+        old.extend(queue_list)
+    
+    def new_move():
+        new.move(rng.randrange(size), rng.randrange(size))
+    
+    def old_shuffle_pick():
+        index = random.randint(0, len(old) - 1)
+        picked = list(old)[index]
+        del old[index]
+        old.append(picked)
+    
+    def new_shuffle_pick():
+        new.append(new.pop(rng.randrange(len(new))))
+    
+    def old_page():
+        start = rng.randrange(size - 10)
+        return list(old)[start:start + 10]
+    
+    def new_page():
+        start = rng.randrange(size - 10)
+        return new.page(start, start + 10)
+    
+    print(f"MusicQueue operations, {size} tracks ({rounds} rounds, microseconds per op)")
+    for name, old_op, new_op in (
+        ("remove", old_remove, new_remove),
+        ("move", old_move, new_move),
+        ("shuffle pick", old_shuffle_pick, new_shuffle_pick),
+        ("page of 10", old_page, new_page),
+    ):
+        old_us = timeit.timeit(old_op, number=rounds) / rounds * 1e6
+        new_us = timeit.timeit(new_op, number=rounds) / rounds * 1e6
+        print(f"  {name:<14} deque {old_us:8.2f}   indexed {new_us:8.2f}   x{old_us / new_us:6.1f}")
+
+
+def bench_dsp(streams=100, frames=250, effects=('bass', 'treble', 'boost', '8d', 'karaoke')):
+    """Per-frame cost of the in-process effect stack across many concurrent streams"""
+    if bot.np is None:
+        print("DSP chain: NumPy not installed, skipped")
+        return
+    
+    rng = random.Random(0)
+    pcm = [bytes(rng.getrandbits(8) for _ in range(3840)) for _ in range(8)]
+    chains = []
+    for guild_id in range(streams):
+        queue = bot.get_queue(guild_id)
+        queue.effects = effects
+        chains.append(bot.DSPChain(queue))
+    
+    for chain in chains:
+        chain.process(pcm[0])
+    
+    started = time.perf_counter()
+    for frame in range(frames):
+        data = pcm[frame % len(pcm)]
+        for chain in chains:
+            chain.process(data)
+    tick_ms = (time.perf_counter() - started) / frames * 1000
+    
+    print(f"DSP chain {'+'.join(effects)}, {streams} streams ({frames} frames each)")
+    print(f"  per stream {tick_ms / streams * 1000:8.1f} us/frame")
+    print(f"  all streams {tick_ms:7.2f} ms per 20 ms tick ({tick_ms / 20:.0%} of budget)")
+
+
+def bench_volume(rounds=20000):
+    """GainStage against the audioop.mul call PCMVolumeTransformer makes on every frame"""
+    rng = random.Random(0)
+    frame = bytes(rng.getrandbits(8) for _ in range(3840))
+    
+    def transformer(volume):
+        return lambda: audioop.mul(frame, 2, min(volume, 2.0))
+    
+    def stage(volume):
+        gain = bot.GainStage(volume)
+        return lambda: gain.process(frame)
+    
+    def ramping():
+        gain = bot.GainStage(0.5, ramp_ms=10 ** 6)
+        gain.set(1.5)
+        return lambda: gain.process(frame)
+    
+    print(f"Volume scaling per 20 ms frame ({rounds} rounds, microseconds per frame)")
+    for name, op in (
+        ("transformer 50%", transformer(0.5)),
+        ("transformer 100%", transformer(1.0)),
+        ("GainStage 50%", stage(0.5)),
+        ("GainStage 100%", stage(1.0)),
+        ("GainStage ramp", ramping()),
+    ):
+        print(f"  {name:<18} {timeit.timeit(op, number=rounds) / rounds * 1e6:8.2f}")
+
+
+if __name__ == "__main__":
+    bench_queue()
+    bench_dsp()
+    bench_volume()
@@ -3,12 +3,31 @@ from discord import app_commands
 from discord.ext import commands, tasks
 import yt_dlp as youtube_dl
 import asyncio
-from collections import deque
+from collections import deque, OrderedDict
+from collections.abc import MutableMapping
 import os
 import time
 import random
+import heapq
+import itertools
+import functools
+import math
+import re
+import json
+import hashlib
+from array import array
+import sqlite3
 from datetime import datetime
 import logging
+import audioop
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 # ═══════════════════════════════════════════════════════════════════════════════
 #                    CORD TITAN V3 - ULTIMATE MUSIC BOT
@@ -17,8 +36,41 @@ import logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger('CordTitan')
 
-intents = discord.Intents.all()
-bot = commands.Bot(command_prefix=['!', '?', '.', 'ct!'], intents=intents, help_command=None)
+load_dotenv()
+
+# Sharding: SHARDED=1 lets Discord pick the shard count; SHARD_COUNT/SHARD_IDS pin this process to a shard range
+SHARD_COUNT = int(os.getenv('SHARD_COUNT', 0)) or None
+SHARD_IDS = [int(shard_id) for shard_id in os.getenv('SHARD_IDS', '').split(',') if shard_id.strip()] or None
+SHARDED = os.getenv('SHARDED', '0') != '0' or SHARD_COUNT is not None
+
+# INTENTS_PROFILE=lean drops member/presence events and caches only members sitting in voice channels
+INTENTS_PROFILE = os.getenv('INTENTS_PROFILE', 'full').lower()
+
+# PREFIX_COMMANDS: all, channels (only PREFIX_CHANNELS) or off (no message events from the gateway at all)
+PREFIX_COMMANDS = os.getenv('PREFIX_COMMANDS', 'all').lower()
+PREFIX_CHANNELS = {int(channel_id) for channel_id in os.getenv('PREFIX_CHANNELS', '').split(',') if channel_id.strip()}
+
+bot_options = {'command_prefix': ['!', '?', '.', 'ct!'], 'help_command': None}
+if INTENTS_PROFILE == 'lean':
+    intents = discord.Intents.none()
+    intents.guilds = True
+    intents.voice_states = True
+    intents.guild_messages = True
+    intents.message_content = True
+    member_cache_flags = discord.MemberCacheFlags.none()
+    member_cache_flags.voice = True
+    bot_options.update(member_cache_flags=member_cache_flags, chunk_guilds_at_startup=False)
+else:
+    intents = discord.Intents.all()
+if PREFIX_COMMANDS == 'off':
+    intents.messages = False
+    intents.message_content = False
+bot_options['intents'] = intents
+
+if SHARDED:
+    bot = commands.AutoShardedBot(**bot_options, shard_count=SHARD_COUNT, shard_ids=SHARD_IDS)
+else:
+    bot = commands.Bot(**bot_options)
 
 # ═══════════════════════════════════════════════════════════════════════════════
 #                              YOUTUBE DL CONFIG
@@ -42,10 +94,91 @@ ytdl_format_options = {
     'no_color': True,
 }
 
+ytdl_flat_options = {
+    **ytdl_format_options,
+    'extract_flat': 'in_playlist',
+}
+
+PLAYLIST_MAX_TRACKS = int(os.getenv('PLAYLIST_MAX_TRACKS', 1000))
+PLAYLIST_BATCH_SIZE = 25
+PLAYLIST_PROGRESS_INTERVAL = 3
+
+EXTRACT_WORKERS = int(os.getenv('EXTRACT_WORKERS', 4))
+
+STREAM_CACHE_SIZE = int(os.getenv('STREAM_CACHE_SIZE', 512))
+STREAM_EXPIRY_MARGIN = 300
+STREAM_DEFAULT_TTL = 3600
+STREAM_REFRESH_INTERVAL = 60
+STREAM_REFRESH_WINDOW = 900
+STREAM_REFRESH_BATCH = int(os.getenv('STREAM_REFRESH_BATCH', 8))
+STREAM_REFRESH_PER_GUILD = 3
+# A stream that errors or hits EOF within this many frames (1s) is treated as a dead URL
+STREAM_FAIL_FRAMES = 50
+
+SEARCH_RESULTS = 10
+SEARCH_CACHE_SIZE = int(os.getenv('SEARCH_CACHE_SIZE', 256))
+SEARCH_CACHE_TTL = int(os.getenv('SEARCH_CACHE_TTL', 6 * 3600))
+
+QUEUE_IDLE_TTL = int(os.getenv('QUEUE_IDLE_TTL', 1800))
+QUEUE_SPILL = os.getenv('QUEUE_SPILL', '0') != '0'
+QUEUE_HISTORY_SIZE = int(os.getenv('QUEUE_HISTORY_SIZE', 100))
+
+NOW_PLAYING_INTERVAL = float(os.getenv('NOW_PLAYING_INTERVAL', 2.0))
+CHANNEL_EDIT_LIMIT = 5
+CHANNEL_EDIT_WINDOW = 5.0
+
+METADATA_DB = os.getenv('METADATA_DB', 'cordtitan.db')
+METADATA_FLUSH_INTERVAL = 2
+METADATA_BATCH_SIZE = 100
+
+LOUDNESS_TARGET = float(os.getenv('LOUDNESS_TARGET', -14.0))
+LOUDNESS_WORKERS = int(os.getenv('LOUDNESS_WORKERS', 2))
+LOUDNESS_MAX_GAIN = 12.0
+LOUDNESS_MAX_DURATION = 1800
+LOUDNESS_CACHE_SIZE = 2048
+LOUDNESS_LIMIT = 0.95
+
+AUDIO_CACHE_DIR = os.getenv('AUDIO_CACHE_DIR', 'audio_cache')
+AUDIO_CACHE_SIZE_MB = int(os.getenv('AUDIO_CACHE_SIZE_MB', 2048))
+AUDIO_CACHE_THRESHOLD = int(os.getenv('AUDIO_CACHE_THRESHOLD', 3))
+AUDIO_CACHE_MAX_DURATION = 1200
+AUDIO_CACHE_EVICTION_WINDOW = 8
+AUDIO_CACHE_DOWNLOAD_WORKERS = 1
+
+FRAME_CACHE_MAX_DURATION = int(os.getenv('FRAME_CACHE_MAX_DURATION', 600))
+FRAME_CACHE_GUILD_MB = int(os.getenv('FRAME_CACHE_GUILD_MB', 24))
+FRAME_CACHE_TOTAL_MB = int(os.getenv('FRAME_CACHE_TOTAL_MB', 256))
+
+ytdl_download_options = {
+    **ytdl_format_options,
+    'format': 'bestaudio[acodec=opus]/bestaudio/best',
+    'outtmpl': os.path.join(AUDIO_CACHE_DIR, 'download-%(id)s.%(ext)s'),
+    'noplaylist': True,
+    'postprocessors': [{'key': 'FFmpegExtractAudio', 'preferredcodec': 'opus'}],
+}
+
 ffmpeg_base_options = {
     'before_options': '-reconnect 1 -reconnect_streamed 1 -reconnect_delay_max 5 -nostdin'
 }
 
+# Resample-based effects change playback speed; (asetrate, atempo) used to map output frames back to track time
+FILTER_RATES = {
+    'nightcore': (44100 * 1.25, 1.0),
+    'vaporwave': (44100 * 0.8, 1.1),
+}
+
+SAMPLE_RATE = 48000
+FRAME_SAMPLES = 960
+# Shelf impulse responses run until the slowest pole has decayed to this fraction
+DSP_DECAY = 1e-4
+
+VOLUME_RAMP_MS = 60
+
+GAPLESS_PRELOAD_FRAMES = 50
+CROSSFADE_MAX = 10
+
+OPUS_PASSTHROUGH = os.getenv('OPUS_PASSTHROUGH', '1') != '0'
+
 AUDIO_FILTERS = {
     'normal': '-vn',
     'bassboost': '-vn -af "bass=g=10,dynaudnorm=f=200"',
@@ -59,12 +192,67 @@ AUDIO_FILTERS = {
     'loud': '-vn -af "volume=2.0,dynaudnorm=f=100"'
 }
 
-ytdl = youtube_dl.YoutubeDL(ytdl_format_options)
+# Each preset's -af chain without the live dynaudnorm stage, for tracks with a measured loudness gain
+FILTER_CHAINS = {
+    name: re.sub(r',?dynaudnorm=f=\d+', '', match.group(1)) if (match := re.search(r'-af "([^"]*)"', options)) else ''
+    for name, options in AUDIO_FILTERS.items()
+}
+DYNAUDNORM_FILTERS = {name for name, options in AUDIO_FILTERS.items() if 'dynaudnorm' in options}
+
+def normalized_options(audio_filter, gain_db):
+    """ffmpeg options for a preset with a measured gain: the preset, the gain, then a limiter in place of dynaudnorm"""
+    stages = [FILTER_CHAINS.get(audio_filter, ''), f'volume={gain_db:.2f}dB', f'alimiter=limit={LOUDNESS_LIMIT}:level=0']
+    return f'-vn -af "{",".join(stage for stage in stages if stage)}"'
+
+def user_count():
+    """Approximate user count from guild member counts; members may be counted once per shared guild"""
+    return sum(guild.member_count or 0 for guild in bot.guilds)
+
+def shard_of(guild_id):
+    """Shard that owns a guild, per Discord's (guild_id >> 22) % shard_count"""
+    return (guild_id >> 22) % (bot.shard_count or 1)
+
+def owns_guild(guild_id):
+    """Whether this process runs the shard a guild belongs to"""
+    shard_ids = getattr(bot, 'shard_ids', None)
+    return shard_ids is None or shard_of(guild_id) in shard_ids
+
+class ShardedState(MutableMapping):
+    """Guild-keyed state kept as one dict per shard, so a shard's guilds can be walked or counted on their own"""
+    
+    def __init__(self):
+        self.shards = {}
+
+    def shard(self, shard_id):
+        return self.shards.get(shard_id, {})
+
+    def rebalance(self):
+        """Re-partition after the shard count changes (e.g. once AutoShardedBot has asked Discord for it)"""
+        entries = [entry for shard in self.shards.values() for entry in shard.items()]
+        self.shards = {}
+        for guild_id, value in entries:
+            self[guild_id] = value
+
+    def __getitem__(self, guild_id):
+        return self.shards.get(shard_of(guild_id), {})[guild_id]
+
+    def __setitem__(self, guild_id, value):
+        self.shards.setdefault(shard_of(guild_id), {})[guild_id] = value
+
+    def __delitem__(self, guild_id):
+        del self.shards.get(shard_of(guild_id), {})[guild_id]
+
+    def __iter__(self):
+        for shard in list(self.shards.values()):
+            yield from list(shard)
+
+    def __len__(self):
+        return sum(len(shard) for shard in self.shards.values())
 
 # Global storage
-music_queues = {}
-dj_roles = {}
-mode_247 = {}
+music_queues = ShardedState()
+dj_roles = ShardedState()
+mode_247 = ShardedState()
 
 bot_stats = {
     'songs_played': 0,
@@ -74,15 +262,1180 @@ bot_stats = {
     'total_playtime': 0
 }
 
+# ═══════════════════════════════════════════════════════════════════════════════
+#                              EXTRACTION SERVICE
+# ═══════════════════════════════════════════════════════════════════════════════
+
+YOUTUBE_ID_PATTERN = re.compile(r'(?:youtube\.com/(?:watch\?(?:.*&)?v=|shorts/|embed/|live/)|youtu\.be/)([\w-]{11})')
+
+def normalize_query(query):
+    """Canonical form of a URL or ytsearch query, used to coalesce identical extractions"""
+    query = query.strip()
+    
+    if query.startswith('ytsearch'):
+        prefix, _, terms = query.partition(':')
+        return f"{prefix}:{' '.join(terms.casefold().split())}"
+    
+    match = YOUTUBE_ID_PATTERN.search(query)
+    if match and 'list=' not in query:
+        return f"https://www.youtube.com/watch?v={match.group(1)}"
+    return query
+
+
+class ExtractionService:
+    """Bounded yt-dlp worker pool with one YoutubeDL per worker thread and per-guild round-robin"""
+    
+    PROFILES = {
+        'default': ytdl_format_options,
+        'flat': ytdl_flat_options,
+    }
+    
+    def __init__(self, workers=EXTRACT_WORKERS):
+        self.workers = workers
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='ytdl')
+        self._local = threading.local()
+        self._pending = OrderedDict()
+        self._active = 0
+        self.completed = 0
+        self.failed = 0
+        self._waits = deque(maxlen=200)
+        self._inflight = {}
+        self.coalesced = 0
+        self.max_callers = 1
+
+    def _ytdl(self, profile):
+        instances = getattr(self._local, 'instances', None)
+        if instances is None:
+            instances = self._local.instances = {}
+        if profile not in instances:
+            instances[profile] = youtube_dl.YoutubeDL(self.PROFILES[profile])
+        return instances[profile]
+
+    async def run(self, func, *, guild_id=None):
+        """Run a blocking callable on the pool once it is this guild's turn"""
+        future = asyncio.get_running_loop().create_future()
+        self._pending.setdefault(guild_id, deque()).append((func, future, time.monotonic()))
+        self._dispatch()
+        return await future
+
+    async def extract(self, query, *, guild_id=None, profile='default'):
+        """extract_info on a worker's own YoutubeDL; identical concurrent requests share one flight"""
+        query = normalize_query(query)
+        key = (query, profile)
+        flight = self._inflight.get(key)
+        
+        if flight is None:
+            flight = asyncio.ensure_future(self.run(
+                lambda: self._ytdl(profile).extract_info(query, download=False),
+                guild_id=guild_id
+            ))
+            flight.callers = 1
+            self._inflight[key] = flight
+            flight.add_done_callback(lambda done: self._land(key, done))
+        else:
+            flight.callers += 1
+            self.coalesced += 1
+            self.max_callers = max(self.max_callers, flight.callers)
+        
+        # Shielded so one caller giving up doesn't cancel the extraction for the others
+        return await asyncio.shield(flight)
+
+    def _land(self, key, flight):
+        self._inflight.pop(key, None)
+        if not flight.cancelled():
+            flight.exception()
+
+    def _dispatch(self):
+        # Take one job per guild in turn so a long playlist can't starve other guilds
+        while self._active < self.workers and self._pending:
+            guild_id, jobs = next(iter(self._pending.items()))
+            func, future, queued_at = jobs.popleft()
+            if jobs:
+                self._pending.move_to_end(guild_id)
+            else:
+                del self._pending[guild_id]
+            
+            if future.done():
+                continue
+            
+            self._active += 1
+            self._waits.append(time.monotonic() - queued_at)
+            asyncio.ensure_future(self._execute(func, future))
+
+    async def _execute(self, func, future):
+        try:
+            result = await asyncio.get_running_loop().run_in_executor(self._executor, func)
+        except Exception as e:
+            self.failed += 1
+            if not future.done():
+                future.set_exception(e)
+        else:
+            self.completed += 1
+            if not future.done():
+                future.set_result(result)
+        finally:
+            self._active -= 1
+            self._dispatch()
+
+    def queue_depth(self, guild_id=None):
+        if guild_id is not None:
+            return len(self._pending.get(guild_id, ()))
+        return sum(len(jobs) for jobs in self._pending.values())
+
+    def inflight(self):
+        return len(self._inflight)
+
+    def busy_workers(self):
+        return self._active
+
+    def wait_times(self):
+        """Average and worst queue wait over recent jobs, in milliseconds"""
+        if not self._waits:
+            return 0.0, 0.0
+        return sum(self._waits) / len(self._waits) * 1000, max(self._waits) * 1000
+
+extractor = ExtractionService()
+
+# ═══════════════════════════════════════════════════════════════════════════════
+#                              STREAM CACHE
+# ═══════════════════════════════════════════════════════════════════════════════
+
+STREAM_DATA_KEYS = (
+    'id', 'url', 'title', 'webpage_url', 'duration', 'thumbnail', 'uploader', 'view_count',
+    'like_count', 'upload_date', 'description', 'format_id', 'acodec', 'ext', 'abr', 'asr', 'is_live'
+)
+
+EXPIRE_PATTERN = re.compile(r'[/?&]expire[=/](\d+)')
+
+def trim_stream_data(data):
+    """Drop formats, thumbnails lists and the rest of the yt-dlp payload"""
+    trimmed = {key: data[key] for key in STREAM_DATA_KEYS if data.get(key) is not None}
+    if 'description' in trimmed:
+        trimmed['description'] = trimmed['description'][:200]
+    return trimmed
+
+def stream_expiry(url):
+    """Expiry timestamp of a signed stream URL (googlevideo 'expire' parameter)"""
+    match = EXPIRE_PATTERN.search(url or '')
+    if match:
+        return int(match.group(1))
+    return time.time() + STREAM_DEFAULT_TTL
+
+
+class StreamCache:
+    """LRU cache of resolved stream URLs keyed by webpage_url, honouring URL expiry"""
+    
+    def __init__(self, max_size=STREAM_CACHE_SIZE, expiry_margin=STREAM_EXPIRY_MARGIN):
+        self.max_size = max_size
+        self.expiry_margin = expiry_margin
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.refreshed = 0
+
+    def expires_at(self, webpage_url):
+        """Expiry of a cached URL without touching LRU order or hit counts"""
+        entry = self._entries.get(webpage_url)
+        return entry[0] if entry else None
+
+    def get(self, webpage_url):
+        entry = self._entries.get(webpage_url)
+        if entry is None:
+            self.misses += 1
+            return None
+        
+        expires_at, data = entry
+        if expires_at - self.expiry_margin <= time.time():
+            del self._entries[webpage_url]
+            self.misses += 1
+            return None
+        
+        self._entries.move_to_end(webpage_url)
+        self.hits += 1
+        return data
+
+    def put(self, data, key=None):
+        """Store resolved data and return the trimmed copy that was cached"""
+        trimmed = trim_stream_data(data)
+        key = key or trimmed.get('webpage_url')
+        if not key or not trimmed.get('url'):
+            return trimmed
+        
+        self._entries[key] = (stream_expiry(trimmed['url']), trimmed)
+        self._entries.move_to_end(key)
+        
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+        return trimmed
+
+    def invalidate(self, webpage_url):
+        self._entries.pop(webpage_url, None)
+
+    def __contains__(self, webpage_url):
+        """Whether a fresh entry is cached, without touching LRU order or hit counts"""
+        entry = self._entries.get(webpage_url)
+        return entry is not None and entry[0] - self.expiry_margin > time.time()
+
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def __len__(self):
+        return len(self._entries)
+
+stream_cache = StreamCache()
+
+async def resolve_stream(webpage_url, *, guild_id=None):
+    """Return stream data for a track, re-extracting only when the cached URL is near expiry"""
+    data = stream_cache.get(webpage_url)
+    if data is None:
+        data = await extract_track_data(webpage_url, guild_id=guild_id)
+        stream_cache.put(data, key=webpage_url)
+    return data
+
+async def refresh_stream(webpage_url, *, guild_id=None):
+    """Re-extract a track ahead of its URL's expiry; the old entry serves until the new one lands"""
+    data = await extract_track_data(webpage_url, guild_id=guild_id)
+    stream_cache.put(data, key=webpage_url)
+    stream_cache.refreshed += 1
+    return data
+
+# ═══════════════════════════════════════════════════════════════════════════════
+#                              SEARCH CACHE
+# ═══════════════════════════════════════════════════════════════════════════════
+
+def search_key(query):
+    return ' '.join(query.casefold().split())
+
+def flat_search_result(entry):
+    """Search result record as used by the search menu and autocomplete"""
+    return {
+        'title': entry.get('title') or 'Unknown',
+        'url': entry.get('webpage_url') or entry.get('url'),
+        'duration': entry.get('duration'),
+        'thumbnail': entry.get('thumbnail') or (entry.get('thumbnails') or [{}])[-1].get('url'),
+        'uploader': entry.get('uploader') or entry.get('channel') or 'Unknown',
+        'views': entry.get('view_count') or 0
+    }
+
+
+class SearchCache:
+    """TTL + LRU cache of flat search results keyed by normalized query"""
+    
+    def __init__(self, max_size=SEARCH_CACHE_SIZE, ttl=SEARCH_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, query):
+        key = search_key(query)
+        entry = self._entries.get(key)
+        if entry is None or entry[0] <= time.time():
+            self._entries.pop(key, None)
+            self.misses += 1
+            return None
+        
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, query, results):
+        key = search_key(query)
+        self._entries[key] = (time.time() + self.ttl, results)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def matching(self, text):
+        """Results of cached queries starting with text, most recently used first"""
+        now = time.time()
+        for key in reversed(self._entries):
+            expires_at, results = self._entries[key]
+            if expires_at > now and key.startswith(text):
+                yield from results
+
+    def __len__(self):
+        return len(self._entries)
+
+
+search_cache = SearchCache()
+
+async def search_tracks(query, *, guild_id=None):
+    """Flat ytsearch results for a query, served from the search cache when fresh"""
+    results = search_cache.get(query)
+    if results is None:
+        data = await extractor.extract(f'ytsearch{SEARCH_RESULTS}:{query}', guild_id=guild_id, profile='flat')
+        results = [flat_search_result(entry) for entry in data.get('entries') or [] if entry]
+        search_cache.put(query, results)
+    return results
+
+async def fetch_track_data(query, *, guild_id=None, metadata_only=False):
+    """Resolve a /play query, answering from the search, stream and metadata caches when possible
+
+    With metadata_only the result may lack a stream URL; it is resolved when the track plays.
+    """
+    if not query.startswith('http'):
+        cached = search_cache.get(query)
+        query = cached[0]['url'] if cached else f'ytsearch:{query}'
+    
+    if query.startswith('http'):
+        # A membership test, so the miss is only counted once, by resolve_stream
+        if metadata_only and query not in stream_cache:
+            stored = await metadata_store.get_track(normalize_query(query))
+            if stored:
+                return stored
+        return await resolve_stream(query, guild_id=guild_id)
+    return await extract_track_data(query, guild_id=guild_id)
+
+def recent_matching(guild_id, text):
+    """The guild's current and previously played tracks, newest first, whose title contains text"""
+    queue = music_queues.get(guild_id)
+    if queue is None:
+        return
+    for track in itertools.chain((queue.current,), reversed(queue.history)):
+        if track is not None and text in track.title.casefold():
+            yield {'title': track.title, 'url': track.webpage_url}
+
+def play_suggestions(current, guild_id, limit=25):
+    """Autocomplete choices from the guild's recent plays and cached searches; never touches yt-dlp"""
+    text = search_key(current)
+    sources = [recent_matching(guild_id, text)]
+    if text:
+        sources.append(search_cache.matching(text))
+    
+    choices = []
+    seen = set()
+    for result in itertools.chain(*sources):
+        url = result['url']
+        if not url or url in seen or len(url) > 100:
+            continue
+        seen.add(url)
+        choices.append(app_commands.Choice(name=result['title'][:100], value=url))
+        if len(choices) >= limit:
+            break
+    return choices
+
+# ═══════════════════════════════════════════════════════════════════════════════
+#                              METADATA STORE
+# ═══════════════════════════════════════════════════════════════════════════════
+
+METADATA_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS tracks (
+    webpage_url TEXT PRIMARY KEY,
+    id TEXT,
+    title TEXT,
+    duration INTEGER,
+    uploader TEXT,
+    thumbnail TEXT,
+    format_id TEXT,
+    acodec TEXT,
+    updated_at REAL
+);
+CREATE TABLE IF NOT EXISTS guild_settings (
+    guild_id INTEGER PRIMARY KEY,
+    dj_role_id INTEGER,
+    mode_247 INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS loudness (
+    webpage_url TEXT NOT NULL,
+    audio_filter TEXT NOT NULL,
+    gain_db REAL NOT NULL,
+    updated_at REAL,
+    PRIMARY KEY (webpage_url, audio_filter)
+);
+CREATE TABLE IF NOT EXISTS queue_state (
+    guild_id INTEGER PRIMARY KEY,
+    state TEXT NOT NULL,
+    saved_at REAL
+);
+'''
+
+TRACK_COLUMNS = ('webpage_url', 'id', 'title', 'duration', 'uploader', 'thumbnail', 'format_id', 'acodec')
+
+
+class MetadataStore:
+    """SQLite (WAL) store of resolved track metadata and guild settings, written in batches off the event loop"""
+    
+    def __init__(self, path=METADATA_DB):
+        self.path = path
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='metadata')
+        self._conn = None
+        self._pending = {}
+        self._flush_handle = None
+        self.writes = 0
+
+    def _connect(self):
+        # Only ever touched from the store's single worker thread
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.executescript(METADATA_SCHEMA)
+            # Older databases kept one unfiltered gain per track on the tracks row; that is the 'normal' gain
+            if 'loudness_gain' in {row[1] for row in conn.execute('PRAGMA table_info(tracks)')}:
+                with conn:
+                    conn.execute(
+                        "INSERT OR IGNORE INTO loudness (webpage_url, audio_filter, gain_db, updated_at) "
+                        "SELECT webpage_url, 'normal', loudness_gain, updated_at FROM tracks WHERE loudness_gain IS NOT NULL"
+                    )
+                    conn.execute("UPDATE tracks SET loudness_gain = NULL WHERE loudness_gain IS NOT NULL")
+            self._conn = conn
+        return self._conn
+
+    async def _call(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    def record(self, data):
+        """Queue a resolved track for the next batched write"""
+        if not data.get('webpage_url'):
+            return
+        
+        row = tuple(data.get(column) for column in TRACK_COLUMNS) + (time.time(),)
+        self._pending[data['webpage_url']] = row
+        
+        if len(self._pending) >= METADATA_BATCH_SIZE:
+            asyncio.ensure_future(self.flush())
+        elif self._flush_handle is None:
+            self._flush_handle = asyncio.get_running_loop().call_later(
+                METADATA_FLUSH_INTERVAL, lambda: asyncio.ensure_future(self.flush())
+            )
+
+    async def flush(self):
+        if self._flush_handle:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        
+        rows = list(self._pending.values())
+        self._pending.clear()
+        if rows:
+            try:
+                await self._call(self._write_tracks, rows)
+                self.writes += len(rows)
+            except sqlite3.Error as e:
+                logger.error(f"Metadata store write failed: {e}")
+
+    def _write_tracks(self, rows):
+        conn = self._connect()
+        with conn:
+            conn.executemany(
+                f"INSERT INTO tracks ({', '.join(TRACK_COLUMNS)}, updated_at) "
+                f"VALUES ({', '.join('?' * (len(TRACK_COLUMNS) + 1))}) "
+                f"ON CONFLICT(webpage_url) DO UPDATE SET "
+                f"{', '.join(f'{column} = excluded.{column}' for column in TRACK_COLUMNS[1:])}, "
+                f"updated_at = excluded.updated_at",
+                rows
+            )
+
+    async def get_track(self, webpage_url):
+        """Stored metadata for a track as a yt-dlp style dict, or None"""
+        pending = self._pending.get(webpage_url)
+        if pending:
+            return dict(zip(TRACK_COLUMNS, pending))
+        
+        try:
+            return await self._call(self._read_track, webpage_url)
+        except sqlite3.Error as e:
+            logger.error(f"Metadata store read failed: {e}")
+            return None
+
+    def _read_track(self, webpage_url):
+        # Loudness-only rows carry no metadata and must not be served as a track
+        row = self._connect().execute(
+            f"SELECT {', '.join(TRACK_COLUMNS)} FROM tracks WHERE webpage_url = ? AND title IS NOT NULL",
+            (webpage_url,)
+        ).fetchone()
+        return dict(zip(TRACK_COLUMNS, row)) if row else None
+
+    async def get_loudness(self, webpage_url, audio_filter):
+        """Stored normalization gain (dB) for a track under a filter preset, or None when it hasn't been analyzed"""
+        row = await self._call(lambda: self._connect().execute(
+            "SELECT gain_db FROM loudness WHERE webpage_url = ? AND audio_filter = ?", (webpage_url, audio_filter)
+        ).fetchone())
+        return row[0] if row else None
+
+    def save_loudness(self, webpage_url, audio_filter, gain_db):
+        row = (webpage_url, audio_filter, gain_db, time.time())
+        future = asyncio.ensure_future(self._call(self._write_loudness, row))
+        future.add_done_callback(lambda done: done.exception() and logger.error(f"Saving loudness failed: {done.exception()}"))
+
+    def _write_loudness(self, row):
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO loudness (webpage_url, audio_filter, gain_db, updated_at) VALUES (?, ?, ?, ?)",
+                row
+            )
+
+    async def load_guild_settings(self):
+        return await self._call(self._read_guild_settings)
+
+    def _read_guild_settings(self):
+        return self._connect().execute("SELECT guild_id, dj_role_id, mode_247 FROM guild_settings").fetchall()
+
+    def save_guild_settings(self, guild_id):
+        """Persist a guild's DJ role and 24/7 flag in the background"""
+        row = (guild_id, dj_roles.get(guild_id), int(mode_247.get(guild_id, False)))
+        future = asyncio.ensure_future(self._call(self._write_guild_settings, row))
+        future.add_done_callback(lambda done: done.exception() and logger.error(f"Saving guild settings failed: {done.exception()}"))
+
+    def _write_guild_settings(self, row):
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                "INSERT INTO guild_settings (guild_id, dj_role_id, mode_247) VALUES (?, ?, ?) "
+                "ON CONFLICT(guild_id) DO UPDATE SET dj_role_id = excluded.dj_role_id, mode_247 = excluded.mode_247",
+                row
+            )
+
+    async def save_queue_state(self, guild_id, state):
+        await self._call(self._write_queue_state, (guild_id, json.dumps(state), time.time()))
+
+    def _write_queue_state(self, row):
+        conn = self._connect()
+        with conn:
+            conn.execute("INSERT OR REPLACE INTO queue_state (guild_id, state, saved_at) VALUES (?, ?, ?)", row)
+
+    async def take_queue_state(self, guild_id):
+        """Read and delete a spilled queue, or None"""
+        return await self._call(self._pop_queue_state, guild_id)
+
+    def _pop_queue_state(self, guild_id):
+        conn = self._connect()
+        with conn:
+            row = conn.execute("SELECT state FROM queue_state WHERE guild_id = ?", (guild_id,)).fetchone()
+            conn.execute("DELETE FROM queue_state WHERE guild_id = ?", (guild_id,))
+        return json.loads(row[0]) if row else None
+
+    async def load_spilled_guilds(self):
+        rows = await self._call(lambda: self._connect().execute("SELECT guild_id FROM queue_state").fetchall())
+        return {guild_id for guild_id, in rows}
+
+metadata_store = MetadataStore()
+
+# ═══════════════════════════════════════════════════════════════════════════════
+#                              AUDIO CACHE
+# ═══════════════════════════════════════════════════════════════════════════════
+
+class AudioCache:
+    """Local Opus copies of frequently played tracks under a size budget
+
+    Files are named after a hash of the normalized webpage_url, so the index can be
+    rebuilt from the directory on startup. Eviction takes the least played file
+    among the least recently used few (LRU window, LFU pick).
+    """
+    
+    def __init__(self, directory=AUDIO_CACHE_DIR, max_bytes=AUDIO_CACHE_SIZE_MB * 1024 * 1024,
+                 threshold=AUDIO_CACHE_THRESHOLD):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.threshold = threshold
+        self._entries = OrderedDict()
+        self._play_counts = OrderedDict()
+        self._downloading = set()
+        # Full downloads hold a thread for minutes, so they stay off the shared extraction pool
+        self._executor = ThreadPoolExecutor(max_workers=AUDIO_CACHE_DOWNLOAD_WORKERS, thread_name_prefix='audio-cache')
+        self._local = threading.local()
+        self.size = 0
+        self.hits = 0
+        self.downloads = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _key(webpage_url):
+        return hashlib.sha1(normalize_query(webpage_url).encode()).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.opus")
+
+    def load(self):
+        """Index the files on disk, oldest first; safe to call again on reconnect"""
+        os.makedirs(self.directory, exist_ok=True)
+        files = []
+        for entry in os.scandir(self.directory):
+            name, ext = os.path.splitext(entry.name)
+            if ext == '.opus' and not name.startswith('download-'):
+                stat = entry.stat()
+                files.append((stat.st_mtime, name, stat.st_size))
+        
+        plays = {key: entry[1] for key, entry in self._entries.items()}
+        self._entries.clear()
+        self.size = 0
+        for _, key, size in sorted(files):
+            self._entries[key] = [size, plays.get(key, 0)]
+            self.size += size
+        self._evict()
+        logger.info(f"Audio cache: {len(self._entries)} files, {self.size / 1048576:.0f} MB")
+
+    def path(self, webpage_url):
+        """Local file for a track about to be played, or None when it isn't cached; counts as a hit"""
+        path = self.peek(webpage_url)
+        if path is not None:
+            key = self._key(webpage_url)
+            self._entries[key][1] += 1
+            self._entries.move_to_end(key)
+            self.hits += 1
+        return path
+
+    def peek(self, webpage_url):
+        """Local file for a track without touching the play counts or eviction order"""
+        if not webpage_url:
+            return None
+        
+        key = self._key(webpage_url)
+        if key not in self._entries:
+            return None
+        
+        path = self._path(key)
+        if not os.path.exists(path):
+            self._forget(key)
+            return None
+        return path
+
+    def __contains__(self, webpage_url):
+        return bool(webpage_url) and self._key(webpage_url) in self._entries
+
+    def note_play(self, track):
+        """Count a play and start a background download once the track is popular enough"""
+        key = self._key(track.webpage_url)
+        if key in self._entries or key in self._downloading:
+            return
+        if not track.duration or track.duration > AUDIO_CACHE_MAX_DURATION:
+            return
+        
+        count = self._play_counts.pop(key, 0) + 1
+        self._play_counts[key] = count
+        if len(self._play_counts) > 4096:
+            self._play_counts.popitem(last=False)
+        
+        if count >= self.threshold:
+            self._downloading.add(key)
+            future = asyncio.ensure_future(self._download(track.webpage_url, key))
+            future.add_done_callback(lambda done: self._downloading.discard(key))
+
+    async def _download(self, webpage_url, key):
+        try:
+            data = await asyncio.get_running_loop().run_in_executor(self._executor, self._fetch, webpage_url)
+            if 'entries' in data:
+                data = data['entries'][0]
+            
+            downloaded = (data.get('requested_downloads') or [{}])[0].get('filepath')
+            if not downloaded or not downloaded.endswith('.opus'):
+                downloaded = os.path.join(self.directory, f"download-{data['id']}.opus")
+            
+            path = self._path(key)
+            os.replace(downloaded, path)
+        except Exception as e:
+            logger.warning(f"Audio cache download failed for {webpage_url}: {e}")
+            return
+        
+        size = os.path.getsize(path)
+        self._entries[key] = [size, 0]
+        self.size += size
+        self._play_counts.pop(key, None)
+        self.downloads += 1
+        self._evict()
+        logger.info(f"Cached audio for {data.get('title', webpage_url)} ({size / 1048576:.1f} MB)")
+
+    def _fetch(self, webpage_url):
+        ytdl = getattr(self._local, 'ytdl', None)
+        if ytdl is None:
+            ytdl = self._local.ytdl = youtube_dl.YoutubeDL(ytdl_download_options)
+        return ytdl.extract_info(webpage_url, download=True)
+
+    def _forget(self, key):
+        size, _ = self._entries.pop(key)
+        self.size -= size
+
+    def _evict(self):
+        while self.size > self.max_bytes and self._entries:
+            window = itertools.islice(self._entries.items(), AUDIO_CACHE_EVICTION_WINDOW)
+            key = min(window, key=lambda item: item[1][1])[0]
+            self._forget(key)
+            self.evictions += 1
+            try:
+                os.remove(self._path(key))
+            except OSError as e:
+                logger.warning(f"Failed to remove cached audio {key}: {e}")
+
+    def __len__(self):
+        return len(self._entries)
+
+audio_cache = AudioCache()
+
+# ═══════════════════════════════════════════════════════════════════════════════
+#                              LOUDNESS ANALYSIS
+# ═══════════════════════════════════════════════════════════════════════════════
+
+LOUDNESS_PATTERN = re.compile(r'I:\s+(-?[\d.]+) LUFS')
+
+class LoudnessAnalyzer:
+    """Measures each track's integrated loudness once per filter preset (ffmpeg ebur128 after the
+    preset's own chain) and keeps the gain that normalizes it"""
+    
+    def __init__(self, target=LOUDNESS_TARGET, workers=LOUDNESS_WORKERS):
+        self.target = target
+        self._gains = OrderedDict()
+        self._running = set()
+        self._semaphore = None
+        self.workers = workers
+        self.analyzed = 0
+        self.failed = 0
+
+    async def gain(self, webpage_url, audio_filter='normal'):
+        """Normalization gain in dB, from memory or the metadata store; None until analyzed"""
+        key = (webpage_url, audio_filter)
+        if key in self._gains:
+            self._gains.move_to_end(key)
+            return self._gains[key]
+        
+        try:
+            gain_db = await metadata_store.get_loudness(webpage_url, audio_filter)
+        except sqlite3.Error as e:
+            logger.error(f"Loudness lookup failed: {e}")
+            return None
+        if gain_db is not None:
+            self._remember(key, gain_db)
+        return gain_db
+
+    def running(self):
+        return len(self._running)
+
+    def _remember(self, key, gain_db):
+        self._gains[key] = gain_db
+        self._gains.move_to_end(key)
+        if len(self._gains) > LOUDNESS_CACHE_SIZE:
+            self._gains.popitem(last=False)
+
+    def analyze(self, track, audio_filter='normal', *, guild_id=None):
+        """Start a background measurement unless the track is known, running or too long"""
+        key = (track.webpage_url, audio_filter)
+        if not track.webpage_url or key in self._gains or key in self._running:
+            return
+        if not track.duration or track.duration > LOUDNESS_MAX_DURATION:
+            return
+        
+        self._running.add(key)
+        future = asyncio.ensure_future(self._analyze(track.webpage_url, audio_filter, guild_id))
+        future.add_done_callback(lambda done: self._running.discard(key))
+
+    async def _analyze(self, webpage_url, audio_filter, guild_id):
+        if await self.gain(webpage_url, audio_filter) is not None:
+            return
+        
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.workers)
+        
+        async with self._semaphore:
+            try:
+                local_path = audio_cache.peek(webpage_url)
+                if local_path:
+                    source, before_options = local_path, ['-nostdin']
+                else:
+                    data = await resolve_stream(webpage_url, guild_id=guild_id)
+                    source, before_options = data['url'], ffmpeg_base_options['before_options'].split()
+                
+                process = await asyncio.create_subprocess_exec(
+                    'ffmpeg', '-hide_banner', '-nostats', *before_options, '-i', source,
+                    '-vn', '-af', ','.join(filter(None, (FILTER_CHAINS.get(audio_filter), 'ebur128=framelog=quiet'))),
+                    '-f', 'null', '-',
+                    stdout=asyncio.subprocess.DEVNULL,
+                    stderr=asyncio.subprocess.PIPE
+                )
+                _, stderr = await process.communicate()
+                matches = LOUDNESS_PATTERN.findall(stderr.decode(errors='replace'))
+                if process.returncode != 0 or not matches:
+                    raise RuntimeError(f"ffmpeg exited with {process.returncode}")
+            except Exception as e:
+                self.failed += 1
+                logger.warning(f"Loudness analysis failed for {webpage_url}: {e}")
+                return
+        
+        measured = float(matches[-1])
+        gain_db = max(-LOUDNESS_MAX_GAIN, min(LOUDNESS_MAX_GAIN, self.target - measured))
+        self._remember((webpage_url, audio_filter), gain_db)
+        metadata_store.save_loudness(webpage_url, audio_filter, gain_db)
+        self.analyzed += 1
+        logger.info(f"Loudness {measured:.1f} LUFS ({audio_filter}), gain {gain_db:+.1f} dB for {webpage_url}")
+
+loudness = LoudnessAnalyzer()
+
+# ═══════════════════════════════════════════════════════════════════════════════
+#                              FRAME CACHE
+# ═══════════════════════════════════════════════════════════════════════════════
+
+class OpusClip:
+    """Encoded Opus packets of one full play, packed into a single bytes arena"""
+    
+    __slots__ = ('key', 'guild_id', 'arena', 'offsets', 'speed')
+    
+    def __init__(self, key, guild_id, arena, offsets, speed=1.0):
+        self.key = key
+        self.guild_id = guild_id
+        self.arena = arena
+        self.offsets = offsets
+        # Track seconds per output second under the recorded filter (see filter_speed)
+        self.speed = speed
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def packet(self, index):
+        return self.arena[self.offsets[index]:self.offsets[index + 1]]
+
+    @property
+    def size(self):
+        return len(self.arena) + self.offsets.itemsize * len(self.offsets)
+
+
+class FrameRecorder:
+    """Collects the packets a source hands to the voice client during its first play"""
+    
+    def __init__(self, cache, key, guild_id):
+        self.cache = cache
+        self.key = key
+        self.guild_id = guild_id
+        self.arena = bytearray()
+        self.offsets = array('I', [0])
+        self.speed = 1.0
+        self.active = True
+
+    def add(self, packet):
+        if not self.active:
+            return
+        self.arena += packet
+        self.offsets.append(len(self.arena))
+        if len(self.arena) > self.cache.guild_budget:
+            self.abort()
+
+    def abort(self):
+        self.active = False
+        self.arena = bytearray()
+        self.offsets = array('I', [0])
+
+    def finish(self):
+        """Hand a complete recording to the cache"""
+        if self.active and len(self.offsets) > 1:
+            self.cache.put(OpusClip(self.key, self.guild_id, bytes(self.arena), self.offsets, self.speed))
+        self.abort()
+
+
+class FrameCache:
+    """LRU of recorded Opus clips keyed by (webpage_url, filter, volume), with per-guild and global budgets"""
+    
+    def __init__(self, guild_budget=FRAME_CACHE_GUILD_MB * 1024 * 1024, total_budget=FRAME_CACHE_TOTAL_MB * 1024 * 1024):
+        self.guild_budget = guild_budget
+        self.total_budget = total_budget
+        self._clips = OrderedDict()
+        self._guild_sizes = {}
+        self.size = 0
+        self.hits = 0
+        self.evictions = 0
+
+    def get(self, webpage_url, audio_filter, volume):
+        key = (webpage_url, audio_filter, volume)
+        clip = self._clips.get(key)
+        if clip is not None:
+            self._clips.move_to_end(key)
+            self.hits += 1
+        return clip
+
+    def recorder(self, track, guild_id, audio_filter, volume):
+        """Recorder for a track's first play, or None when it's too long or already cached"""
+        if not track.duration or track.duration > FRAME_CACHE_MAX_DURATION:
+            return None
+        key = (track.webpage_url, audio_filter, volume)
+        if key in self._clips:
+            return None
+        return FrameRecorder(self, key, guild_id)
+
+    def put(self, clip):
+        self._drop(clip.key)
+        self._clips[clip.key] = clip
+        self.size += clip.size
+        self._guild_sizes[clip.guild_id] = self._guild_sizes.get(clip.guild_id, 0) + clip.size
+        
+        while self._guild_sizes[clip.guild_id] > self.guild_budget:
+            self._evict(next(key for key, cached in self._clips.items() if cached.guild_id == clip.guild_id))
+        while self.size > self.total_budget:
+            self._evict(next(iter(self._clips)))
+
+    def _evict(self, key):
+        self._drop(key)
+        self.evictions += 1
+
+    def _drop(self, key):
+        clip = self._clips.pop(key, None)
+        if clip is None:
+            return
+        self.size -= clip.size
+        self._guild_sizes[clip.guild_id] -= clip.size
+        if not self._guild_sizes[clip.guild_id]:
+            del self._guild_sizes[clip.guild_id]
+
+    def clear_guild(self, guild_id):
+        for key in [key for key, clip in self._clips.items() if clip.guild_id == guild_id]:
+            self._drop(key)
+
+    def __len__(self):
+        return len(self._clips)
+
+frame_cache = FrameCache()
+
+# ═══════════════════════════════════════════════════════════════════════════════
+#                              DSP CHAIN
+# ═══════════════════════════════════════════════════════════════════════════════
+
+def fft_size(n):
+    """Smallest 2^a * 3^b * 5^c at or above n; pocketfft is slow on sizes with large prime factors"""
+    while True:
+        m = n
+        for factor in (2, 3, 5):
+            while m % factor == 0:
+                m //= factor
+        if m == 1:
+            return n
+        n += 1
+
+def shelf_coefficients(kind, freq, gain_db):
+    """RBJ cookbook low/high shelf biquad (slope 1), normalized so a0 == 1"""
+    a = 10 ** (gain_db / 40)
+    w0 = 2 * math.pi * freq / SAMPLE_RATE
+    cos_w0 = math.cos(w0)
+    alpha = math.sin(w0) / 2 * math.sqrt(2)
+    root = 2 * math.sqrt(a) * alpha
+    sign = 1 if kind == 'low' else -1
+    
+    b0 = a * ((a + 1) - sign * (a - 1) * cos_w0 + root)
+    b1 = sign * 2 * a * ((a - 1) - sign * (a + 1) * cos_w0)
+    b2 = a * ((a + 1) - sign * (a - 1) * cos_w0 - root)
+    a0 = (a + 1) + sign * (a - 1) * cos_w0 + root
+    a1 = -sign * 2 * ((a - 1) + sign * (a + 1) * cos_w0)
+    a2 = (a + 1) + sign * (a - 1) * cos_w0 - root
+    return (b0 / a0, b1 / a0, b2 / a0), (a1 / a0, a2 / a0)
+
+@functools.lru_cache(maxsize=None)
+def shelf_response(kind, freq, gain_db):
+    """The shelf's impulse response, cut once |pole|^n is down to DSP_DECAY
+
+    Low shelves have poles close to the unit circle (|p| ~ 0.995 at 100 Hz), so these
+    run to well over a thousand taps.
+    """
+    (b0, b1, b2), (a1, a2) = shelf_coefficients(kind, freq, gain_db)
+    radius = max(abs(pole) for pole in np.roots([1.0, a1, a2]))
+    taps = max(3, math.ceil(math.log(DSP_DECAY) / math.log(radius)) + 3) if radius > 0 else 3
+    response = np.zeros(taps, dtype=np.float64)
+    x1 = x2 = y1 = y2 = 0.0
+    for n in range(taps):
+        x0 = 1.0 if n == 0 else 0.0
+        y0 = b0 * x0 + b1 * x1 + b2 * x2 - a1 * y1 - a2 * y2
+        response[n] = y0
+        x1, x2, y1, y2 = x0, x1, y0, y1
+    return response
+
+
+class ShelfEQ:
+    """Bass/treble shelf biquad"""
+    
+    def __init__(self, kind, freq, gain_db):
+        self.kind = kind
+        self.freq = freq
+        self.gain_db = gain_db
+
+    def response(self):
+        return shelf_response(self.kind, self.freq, self.gain_db)
+
+
+class Gain:
+    def __init__(self, gain_db):
+        self.factor = 10 ** (gain_db / 20)
+
+
+class LinearStage:
+    """Adjacent EQs and gains folded into one FFT overlap-add convolution (or a plain multiply)"""
+    
+    def __init__(self, parts):
+        self.factor = math.prod(part.factor for part in parts if isinstance(part, Gain))
+        responses = [part.response() for part in parts if isinstance(part, ShelfEQ)]
+        self.spectrum = None
+        if responses:
+            # Cascaded responses convolve into one of (sum of lengths - 1) taps; the block has to
+            # hold a frame plus that tail or the overlap-add wraps around
+            taps = sum(len(response) - 1 for response in responses) + 1
+            self.size = fft_size(FRAME_SAMPLES + taps - 1)
+            spectrum = self.factor
+            for response in responses:
+                spectrum = spectrum * np.fft.rfft(response, self.size)
+            self.spectrum = spectrum[:, None].astype(np.complex64)
+            self.tail = np.zeros((self.size - FRAME_SAMPLES, 2), dtype=np.float32)
+
+    def process(self, samples):
+        if self.spectrum is None:
+            samples *= self.factor
+            return samples
+        
+        out = np.fft.irfft(np.fft.rfft(samples, self.size, axis=0) * self.spectrum, self.size, axis=0)
+        count = len(samples)
+        out[:len(self.tail)] += self.tail
+        self.tail = out[count:]
+        return out[:count]
+
+
+class Pulsator:
+    """Pans the signal between the channels on a slow LFO (the 8D effect)"""
+    
+    def __init__(self, hz=0.08, amount=0.8):
+        self.step = 2 * math.pi * hz * FRAME_SAMPLES / SAMPLE_RATE
+        self.amount = amount
+        self.phase = 0.0
+
+    def process(self, samples):
+        # The LFO moves ~0.1% of a cycle per frame, so one gain per frame is smooth enough
+        lfo = 0.5 + 0.5 * math.sin(self.phase)
+        self.phase = (self.phase + self.step) % (2 * math.pi)
+        samples *= np.array([1 - self.amount * (1 - lfo), 1 - self.amount * lfo], dtype=np.float32)
+        return samples
+
+
+class MidSide:
+    """Scales the centre (mid) channel; a low mid level strips most lead vocals"""
+    
+    def __init__(self, mid_level=0.03):
+        keep, cut = (mid_level + 1) / 2, (mid_level - 1) / 2
+        self.matrix = np.array([[keep, cut], [cut, keep]], dtype=np.float32)
+
+    def process(self, samples):
+        return samples @ self.matrix
+
+
+class GainStage:
+    """Frame volume with a linear ramp after each change; unity gain hands frames through untouched"""
+    
+    def __init__(self, volume=1.0, ramp_ms=VOLUME_RAMP_MS):
+        self.volume = volume
+        self.target = self.current = min(volume, 2.0)
+        self.ramp_samples = max(1, int(SAMPLE_RATE * ramp_ms / 1000))
+        self.step = 0.0
+        if np is not None:
+            self._ramp = np.arange(1, FRAME_SAMPLES + 1, dtype=np.float32).repeat(2)
+            self._gains = np.empty(FRAME_SAMPLES * 2, dtype=np.float32)
+            self._scaled = np.empty(FRAME_SAMPLES * 2, dtype=np.float32)
+            self._out = np.empty(FRAME_SAMPLES * 2, dtype=np.int16)
+
+    def set(self, volume):
+        self.volume = volume
+        self.target = min(volume, 2.0)
+        self.step = (self.target - self.current) / self.ramp_samples
+
+    def process(self, data):
+        if not data or (self.current == self.target == 1.0):
+            return data
+        
+        # A constant gain is a single saturating pass in audioop; NumPy only does the ramps
+        if self.current == self.target:
+            return audioop.mul(data, 2, self.current)
+        
+        if np is None or len(data) != FRAME_SAMPLES * 4:
+            # Without NumPy the ramp moves once per frame
+            moved = self.current + self.step * (len(data) // 4)
+            self.current = min(moved, self.target) if self.step > 0 else max(moved, self.target)
+            return audioop.mul(data, 2, self.current)
+        
+        # frombuffer views the frame in place; the scratch arrays are reused every frame
+        gains = self._gains
+        np.multiply(self._ramp, self.step, out=gains)
+        gains += self.current
+        if self.step > 0:
+            np.minimum(gains, self.target, out=gains)
+        else:
+            np.maximum(gains, self.target, out=gains)
+        self.current = self.target if gains[-1] == self.target else float(gains[-1])
+        
+        np.multiply(np.frombuffer(data, dtype=np.int16), gains, out=self._scaled)
+        np.clip(self._scaled, -32768, 32767, out=self._scaled)
+        np.copyto(self._out, self._scaled, casting='unsafe')
+        return self._out.tobytes()
+
+
+DSP_EFFECTS = {
+    'bass': lambda: ShelfEQ('low', 100, 10),
+    'superbass': lambda: ShelfEQ('low', 100, 20),
+    'treble': lambda: ShelfEQ('high', 3000, 5),
+    'boost': lambda: Gain(6),
+    'quiet': lambda: Gain(-6),
+    '8d': lambda: Pulsator(),
+    'karaoke': lambda: MidSide(),
+}
+
+
+class DSPChain:
+    """Per-source in-process effect stack, following the guild's effect list at frame boundaries"""
+    
+    def __init__(self, queue):
+        # Held directly: process() runs on the audio thread, where get_queue() must not be called
+        self.queue = queue
+        self._names = ()
+        self._stages = {}
+
+    def _sync(self, names):
+        # Stages that survive the change keep their state (filter tails, LFO phase)
+        stages = {}
+        linear = []
+        for name in names + (None,):
+            effect = DSP_EFFECTS[name]() if name else None
+            if isinstance(effect, (ShelfEQ, Gain)):
+                linear.append(name)
+                continue
+            if linear:
+                key = tuple(linear)
+                stages[key] = self._stages.get(key) or LinearStage([DSP_EFFECTS[part]() for part in key])
+                linear = []
+            if name:
+                stages[name] = self._stages.get(name) or effect
+        self._stages = stages
+        self._names = names
+
+    def process(self, data):
+        names = self.queue.effects
+        if names != self._names:
+            self._sync(names)
+        if not self._stages or not data:
+            return data
+        
+        samples = np.frombuffer(data, dtype=np.int16).reshape(-1, 2).astype(np.float32)
+        for stage in self._stages.values():
+            samples = stage.process(samples)
+        return np.clip(samples, -32768, 32767).astype(np.int16).tobytes()
+
 # ═══════════════════════════════════════════════════════════════════════════════
 #                              AUDIO SOURCE CLASS
 # ═══════════════════════════════════════════════════════════════════════════════
 
-class YTDLSource(discord.PCMVolumeTransformer):
+def filter_speed(audio_filter, data):
+    """Track seconds covered by one second of output under a filter"""
+    if audio_filter not in FILTER_RATES:
+        return 1.0
+    rate, tempo = FILTER_RATES[audio_filter]
+    return rate / (data.get('asr') or 48000) * tempo
+
+def ffmpeg_input_options(start_at=0, *, local=False):
+    """ffmpeg before_options, seeking on the input when resuming mid-track"""
+    # The reconnect options only apply to HTTP inputs
+    before_options = '-nostdin' if local else ffmpeg_base_options['before_options']
+    if start_at:
+        before_options += f' -ss {start_at:.2f}'
+    return before_options
+
+
+class YTDLSource(discord.AudioSource):
     """Enhanced audio source with filters and metadata"""
     
-    def __init__(self, source, *, data, volume=0.5):
-        super().__init__(source, volume)
+    def __init__(self, source, *, data, volume=0.5, start_at=0):
+        self.original = source
+        self.gain = GainStage(volume)
         self.data = data
         self.title = data.get('title', 'Unknown')
         self.url = data.get('url')
@@ -93,99 +1446,963 @@ class YTDLSource(discord.PCMVolumeTransformer):
         self.views = data.get('view_count', 0)
         self.likes = data.get('like_count', 0)
         self.upload_date = data.get('upload_date')
-        self.description = data.get('description', '')[:200]
+        self.description = (data.get('description') or '')[:200]
         self.requester = None
         self.audio_filter = 'normal'
+        self.start_at = start_at
+        self.frames = 0
+        self.ended = False
+        self.speed = 1.0
+        self.recorder = None
+        self.encoder = None
+        self.dsp = None
+        self._preloaded = deque()
 
     @classmethod
-    async def from_url(cls, url, *, loop=None, stream=True, requester=None, audio_filter='normal'):
-        """Create audio source from URL with optional audio filter"""
-        loop = loop or asyncio.get_event_loop()
-        data = await loop.run_in_executor(None, lambda: ytdl.extract_info(url, download=not stream))
-        
-        if 'entries' in data:
-            data = data['entries'][0]
-        
-        filename = data['url'] if stream else ytdl.prepare_filename(data)
-        
-        filter_options = AUDIO_FILTERS.get(audio_filter, AUDIO_FILTERS['normal'])
+    def from_data(cls, data, *, volume=0.5, requester=None, audio_filter='normal', start_at=0, gain_db=None):
+        """Build the ffmpeg pipeline for already extracted track data; a known loudness gain replaces dynaudnorm"""
+        if gain_db is None:
+            filter_options = AUDIO_FILTERS.get(audio_filter, AUDIO_FILTERS['normal'])
+        else:
+            filter_options = normalized_options(audio_filter, gain_db)
         ffmpeg_options = {
             'options': filter_options,
-            **ffmpeg_base_options
+            'before_options': ffmpeg_input_options(start_at, local=data.get('local', False))
         }
         
-        source = cls(discord.FFmpegPCMAudio(filename, **ffmpeg_options), data=data)
+        source = cls(
+            discord.FFmpegPCMAudio(data['url'], **ffmpeg_options),
+            data=data,
+            volume=volume,
+            start_at=start_at
+        )
         source.requester = requester
         source.audio_filter = audio_filter
+        source.speed = filter_speed(audio_filter, data)
         return source
 
-    async def recreate(self, audio_filter=None):
-        """Recreate the audio source with optional new filter"""
-        loop = asyncio.get_event_loop()
-        data = await loop.run_in_executor(None, lambda: ytdl.extract_info(self.webpage_url, download=False))
+    def record(self, recorder):
+        """Encode to Opus here instead of in the voice client so the packets can be kept"""
+        self.recorder = recorder
+        recorder.speed = self.speed
+        self.encoder = discord.opus.Encoder()
+
+    @property
+    def volume(self):
+        return self.gain.volume
+
+    @volume.setter
+    def volume(self, value):
+        self.gain.set(value)
+
+    def is_opus(self):
+        return self.encoder is not None
+
+    def preload(self, count):
+        """Read ahead (blocking) so ffmpeg is connected and buffered before the source goes live"""
+        for _ in range(count):
+            frame = self.original.read()
+            if not frame:
+                break
+            self._preloaded.append(frame)
+
+    def read(self):
+        self.frames += 1
+        frame = self._preloaded.popleft() if self._preloaded else self.original.read()
+        if not frame:
+            self.ended = True
+        data = self.gain.process(frame)
+        if self.dsp is not None:
+            data = self.dsp.process(data)
+        if self.encoder is None:
+            return data
         
-        if 'entries' in data:
-            data = data['entries'][0]
+        if not data:
+            # A stream that died right away isn't worth replaying from memory
+            if self.frames < STREAM_FAIL_FRAMES:
+                self.recorder.abort()
+            else:
+                self.recorder.finish()
+            return data
         
-        use_filter = audio_filter or self.audio_filter
-        filter_options = AUDIO_FILTERS.get(use_filter, AUDIO_FILTERS['normal'])
-        ffmpeg_options = {
-            'options': filter_options,
-            **ffmpeg_base_options
+        packet = self.encoder.encode(data, discord.opus.Encoder.SAMPLES_PER_FRAME)
+        self.recorder.add(packet)
+        return packet
+
+    def cleanup(self):
+        if self.recorder is not None:
+            self.recorder.abort()
+        self.original.cleanup()
+
+    @property
+    def position(self):
+        """Seconds into the track, counted from the 20ms frames handed to the voice client"""
+        return self.start_at + self.frames * 0.02 * self.speed
+
+    def format_duration(self):
+        """Format duration as MM:SS or HH:MM:SS"""
+        return format_track_duration(self.duration)
+
+
+class YTDLOpusSource(discord.FFmpegOpusAudio):
+    """Passes an Opus stream straight through to Discord without decoding or re-encoding"""
+    
+    def __init__(self, filename, *, data, start_at=0):
+        # codec='opus' makes discord.py run ffmpeg with -c:a copy; the codec comes from the
+        # yt-dlp format metadata so no ffprobe run is needed
+        super().__init__(
+            filename,
+            codec='opus',
+            before_options=ffmpeg_input_options(start_at, local=data.get('local', False)),
+            options='-vn'
+        )
+        self.data = data
+        self.webpage_url = data.get('webpage_url')
+        self.requester = None
+        self.audio_filter = 'normal'
+        self.start_at = start_at
+        self.frames = 0
+        self.ended = False
+        self.recorder = None
+
+    @staticmethod
+    def supports(data, *, volume, audio_filter):
+        """Passthrough only works when nothing needs to touch the PCM"""
+        return OPUS_PASSTHROUGH and audio_filter == 'normal' and volume == 1.0 and data.get('acodec') == 'opus'
+
+    @property
+    def volume(self):
+        return 1.0
+
+    def record(self, recorder):
+        self.recorder = recorder
+
+    def read(self):
+        self.frames += 1
+        packet = super().read()
+        if not packet:
+            self.ended = True
+        if self.recorder is not None:
+            if packet:
+                self.recorder.add(packet)
+            elif self.frames < STREAM_FAIL_FRAMES:
+                self.recorder.abort()
+            else:
+                self.recorder.finish()
+        return packet
+
+    def cleanup(self):
+        if self.recorder is not None:
+            self.recorder.abort()
+        super().cleanup()
+
+    @property
+    def position(self):
+        return self.start_at + self.frames * 0.02
+
+
+class CachedOpusSource(discord.AudioSource):
+    """Replays a recorded clip from memory; no ffmpeg and no encoding"""
+    
+    def __init__(self, clip, *, start_at=0):
+        self.clip = clip
+        self.webpage_url, self.audio_filter, self._volume = clip.key
+        self.requester = None
+        self.start_at = start_at
+        self.frames = 0
+
+    def is_opus(self):
+        return True
+
+    @property
+    def volume(self):
+        return self._volume
+
+    def read(self):
+        if self.frames >= len(self.clip):
+            return b''
+        packet = self.clip.packet(self.frames)
+        self.frames += 1
+        return packet
+
+    @property
+    def position(self):
+        return self.start_at + self.frames * 0.02 * self.clip.speed
+
+
+class GaplessSource(discord.AudioSource):
+    """Plays a guild's tracks back to back, switching to a pre-warmed next pipeline on the frame the current one ends
+
+    The next track comes from the queue's peek_next() and is re-targeted whenever the
+    queue changes; with crossfade set, the tail of the current track is mixed with the
+    head of the next one. The voice client's after callback only fires when nothing
+    was ready to switch to.
+    """
+    
+    def __init__(self, guild_id, source, track, *, crossfade=0):
+        self.guild_id = guild_id
+        self.current = source
+        self.track = track
+        self.crossfade = crossfade
+        self.next_source = None
+        self.next_track = None
+        self.recorder = None
+        self._fade_total = 0
+        self._fade_step = 0
+        self._closed = False
+        # Pipelines swapped out by the event loop are cleaned up on the audio thread,
+        # which may still be reading from them
+        self._retired = []
+        self._lock = threading.Lock()
+
+    @property
+    def volume(self):
+        return self.current.volume
+
+    @volume.setter
+    def volume(self, value):
+        with self._lock:
+            self.current.volume = value
+            if self.next_source is not None:
+                self.next_source.volume = value
+
+    @property
+    def position(self):
+        return self.current.position
+
+    def schedule(self, track):
+        """Warm up the pipeline for the track that will follow the current one"""
+        if self._closed or track is self.next_track:
+            return
+        self._drop_next()
+        self.next_track = track
+        if track is not None:
+            warming = asyncio.ensure_future(self._warm(track))
+            warming.add_done_callback(Prefetcher._log_failure)
+
+    def replace(self, source):
+        """Swap the current pipeline (filter or volume rebuild); the warmed next one is rebuilt to match"""
+        with self._lock:
+            self._retired.append(self.current)
+            self.current = source
+            self._fade_total = 0
+        self._drop_next()
+
+    async def _warm(self, track):
+        queue = get_queue(self.guild_id)
+        await queue.prefetcher.wait(track)
+        source = await track.create_source(
+            volume=queue.volume / 100,
+            audio_filter=queue.audio_filter,
+            guild_id=self.guild_id,
+            pcm=True
+        )
+        await asyncio.get_running_loop().run_in_executor(None, source.preload, GAPLESS_PRELOAD_FRAMES)
+        
+        # A target that changed while warming is dropped here rather than cancelled,
+        # so an ffmpeg process that already started is always cleaned up
+        with self._lock:
+            if not self._closed and self.next_track is track:
+                self.next_source = source
+                return
+        source.cleanup()
+
+    def _drop_next(self):
+        with self._lock:
+            if self.next_source is not None:
+                self._retired.append(self.next_source)
+            self.next_source = None
+            self.next_track = None
+            self._fade_total = 0
+
+    def _fading(self, current):
+        if self._fade_total:
+            return True
+        if not self.crossfade or not self.track.duration:
+            return False
+        remaining = (self.track.duration - current.position) / current.speed
+        if remaining > self.crossfade:
+            return False
+        self._fade_total = max(1, int(remaining / 0.02))
+        self._fade_step = 0
+        return True
+
+    def read(self):
+        with self._lock:
+            current, upcoming = self.current, self.next_source
+            retired, self._retired = self._retired, []
+        for source in retired:
+            source.cleanup()
+        
+        data = current.read()
+        if upcoming is not None and data and self._fading(current):
+            incoming = upcoming.read()
+            if len(incoming) != len(data):
+                self._fade_total = 0
+                return data
+            self._fade_step += 1
+            mix = min(1.0, self._fade_step / self._fade_total)
+            data = audioop.add(audioop.mul(data, 2, 1.0 - mix), audioop.mul(incoming, 2, mix), 2)
+            if mix >= 1.0:
+                self._switch(upcoming)
+        elif not data and upcoming is not None and self._switch(upcoming):
+            data = upcoming.read()
+        return data
+
+    def _switch(self, upcoming):
+        with self._lock:
+            if self.next_source is not upcoming:
+                return False
+            self._retired.append(self.current)
+            self.current, self.next_source = upcoming, None
+            self.track, self.next_track = self.next_track, None
+            self._fade_total = 0
+        # Queue bookkeeping belongs to the event loop; the audio thread keeps going
+        asyncio.run_coroutine_threadsafe(gapless_advance(self.guild_id, self.track), bot.loop)
+        return True
+
+    def cleanup(self):
+        with self._lock:
+            self._closed = True
+            sources = [self.current, self.next_source, *self._retired]
+            self.next_source = None
+            self._retired = []
+        for source in sources:
+            if source is not None:
+                source.cleanup()
+
+
+class RequesterRef:
+    """Stand-in for the requesting member in history and restored queues; keeps only the id"""
+    
+    __slots__ = ('id',)
+    
+    def __init__(self, id):
+        self.id = id
+
+    @property
+    def mention(self):
+        return f'<@{self.id}>'
+
+
+class QueuedTrack:
+    """Metadata-only queue entry; the ffmpeg source is built when it starts playing"""
+    
+    __slots__ = (
+        'title', 'webpage_url', 'duration', 'uploader', 'thumbnail', 'requester',
+        'views', 'likes', 'upload_date', 'description', 'audio_filter'
+    )
+    
+    def __init__(self, *, title, webpage_url, duration=0, uploader='Unknown', thumbnail=None, requester=None,
+                 views=0, likes=0, upload_date=None, description=''):
+        self.title = title
+        self.webpage_url = webpage_url
+        self.duration = duration
+        self.uploader = uploader
+        self.thumbnail = thumbnail
+        self.requester = requester
+        self.views = views
+        self.likes = likes
+        self.upload_date = upload_date
+        self.description = description
+        self.audio_filter = 'normal'
+
+    @classmethod
+    def from_data(cls, data, requester=None):
+        """Keep only the fields the queue and embeds need from yt-dlp data"""
+        return cls(
+            title=data.get('title', 'Unknown'),
+            webpage_url=data.get('webpage_url') or data.get('url'),
+            duration=data.get('duration') or 0,
+            uploader=data.get('uploader') or data.get('channel') or 'Unknown',
+            thumbnail=data.get('thumbnail') or (data.get('thumbnails') or [{}])[-1].get('url'),
+            requester=requester,
+            views=data.get('view_count') or 0,
+            likes=data.get('like_count') or 0,
+            upload_date=data.get('upload_date'),
+            description=(data.get('description') or '')[:200]
+        )
+
+    def to_record(self):
+        """Compact, JSON-safe form used for history and spilled queues"""
+        return {
+            'title': self.title,
+            'webpage_url': self.webpage_url,
+            'duration': self.duration,
+            'uploader': self.uploader,
+            'thumbnail': self.thumbnail,
+            'views': self.views,
+            'requester': self.requester.id if self.requester else None,
         }
+
+    @classmethod
+    def from_record(cls, record):
+        requester = record.pop('requester', None)
+        return cls(**record, requester=RequesterRef(requester) if requester else None)
+
+    def trimmed(self):
+        """Copy without the description or the member object, for history"""
+        return QueuedTrack.from_record(self.to_record())
+
+    async def create_source(self, *, data=None, volume=0.5, audio_filter='normal', guild_id=None, start_at=0, pcm=False):
+        """Resolve the stream (unless data is given or the audio is cached locally) and build the playable source
+
+        pcm=True always builds a YTDLSource, for callers that mix or splice the PCM themselves;
+        it is implied while the guild has in-process effects enabled.
+        """
+        self.audio_filter = audio_filter
+        queue = get_queue(guild_id) if guild_id is not None else None
+        if queue is not None and queue.effects:
+            pcm = True
+        
+        # A measured loudness gain stands in for dynaudnorm, and for everything when the guild normalizes
+        gain_db = None
+        if queue is not None and (queue.normalize or audio_filter in DYNAUDNORM_FILTERS):
+            gain_db = await loudness.gain(self.webpage_url, audio_filter)
+            if gain_db is not None:
+                pcm = True
+        if not start_at and not pcm:
+            clip = frame_cache.get(self.webpage_url, audio_filter, volume)
+            if clip is not None:
+                source = CachedOpusSource(clip)
+                source.requester = self.requester
+                return source
+        
+        local_path = audio_cache.path(self.webpage_url)
+        if local_path:
+            data = {
+                **(data or {'title': self.title, 'duration': self.duration, 'thumbnail': self.thumbnail,
+                            'uploader': self.uploader, 'description': self.description}),
+                'url': local_path,
+                'webpage_url': self.webpage_url,
+                'acodec': 'opus',
+                'asr': 48000,
+                'local': True,
+            }
+        elif data is None:
+            data = await resolve_stream(self.webpage_url, guild_id=guild_id)
+        
+        if not pcm and YTDLOpusSource.supports(data, volume=volume, audio_filter=audio_filter):
+            source = YTDLOpusSource(data['url'], data=data, start_at=start_at)
+            source.requester = self.requester
+        else:
+            source = YTDLSource.from_data(
+                data,
+                volume=volume,
+                requester=self.requester,
+                audio_filter=audio_filter,
+                start_at=start_at,
+                gain_db=gain_db
+            )
+            if np is not None and queue is not None:
+                source.dsp = DSPChain(queue)
         
-        new_source = YTDLSource(discord.FFmpegPCMAudio(data['url'], **ffmpeg_options), data=data, volume=self.volume)
-        new_source.requester = self.requester
-        new_source.audio_filter = use_filter
-        return new_source
+        # Record full plays so loops, /replay and /previous can come straight from memory
+        recorder = frame_cache.recorder(self, guild_id, audio_filter, volume) if not start_at and not pcm else None
+        if recorder is not None:
+            source.record(recorder)
+        return source
 
     def format_duration(self):
         """Format duration as MM:SS or HH:MM:SS"""
-        if not self.duration:
-            return "LIVE"
+        return format_track_duration(self.duration)
+
+
+def format_track_duration(duration):
+    if not duration:
+        return "LIVE"
+    
+    hours, remainder = divmod(int(duration), 3600)
+    minutes, seconds = divmod(remainder, 60)
+    
+    if hours > 0:
+        return f"{hours:02d}:{minutes:02d}:{seconds:02d}"
+    return f"{minutes:02d}:{seconds:02d}"
+
+
+async def extract_track_data(query, *, guild_id=None):
+    """Run a full yt-dlp extraction, cache the stream and return the trimmed track entry"""
+    data = await extractor.extract(query, guild_id=guild_id)
+    
+    if 'entries' in data:
+        if not data['entries']:
+            raise ValueError("No results found")
+        data = data['entries'][0]
+    
+    data = stream_cache.put(data)
+    metadata_store.record(data)
+    return data
+
+# ═══════════════════════════════════════════════════════════════════════════════
+#                              PLAYLIST LOADER
+# ═══════════════════════════════════════════════════════════════════════════════
+
+class PlaylistLoader:
+    """Reads a playlist's flat entry list in batches without resolving each track"""
+    
+    def __init__(self, url, *, guild_id=None, max_tracks=PLAYLIST_MAX_TRACKS, batch_size=PLAYLIST_BATCH_SIZE):
+        self.url = url
+        self.guild_id = guild_id
+        self.max_tracks = max_tracks
+        self.batch_size = batch_size
+        self.title = 'Playlist'
+        self._ytdl = None
+        self._entries = None
+
+    def _open(self):
+        # The loader owns its YoutubeDL because the lazy entry generator keeps using it between batches
+        self._ytdl = youtube_dl.YoutubeDL(ytdl_flat_options)
+        info = self._ytdl.extract_info(self.url, download=False, process=False)
+        
+        for _ in range(3):
+            if info.get('_type') not in ('url', 'url_transparent'):
+                break
+            info = self._ytdl.extract_info(info['url'], download=False, process=False, ie_key=info.get('ie_key'))
+        
+        if 'entries' not in info:
+            return False
+        
+        self.title = info.get('title') or 'Playlist'
+        self._entries = itertools.islice(iter(info['entries']), self.max_tracks)
+        return True
+
+    def _next_batch(self):
+        return list(itertools.islice(self._entries, self.batch_size))
+
+    async def open(self):
+        """Fetch the playlist header; returns False when the URL isn't a playlist"""
+        return await extractor.run(self._open, guild_id=self.guild_id)
+
+    async def batches(self):
+        """Yield lists of flat entries as the extractor pages through the playlist"""
+        while True:
+            # One page per pool job so other guilds get a worker between pages
+            batch = await extractor.run(self._next_batch, guild_id=self.guild_id)
+            if not batch:
+                break
+            yield [entry for entry in batch if entry]
+
+# ═══════════════════════════════════════════════════════════════════════════════
+#                              INDEXED QUEUE
+# ═══════════════════════════════════════════════════════════════════════════════
+
+class IndexedQueue:
+    """List of blocks with a Fenwick tree over block sizes
+
+    Positional lookup, insert and delete find their block in O(log n) and then
+    touch a single block; slicing a page costs O(log n + page size). Items are
+    expected to be unique and hashable: each one maps to the block holding it,
+    which makes membership O(1) and index()/remove() O(log n + block size).
+    """
+    
+    LOAD = 256
+    
+    def __init__(self, items=()):
+        self._blocks = []
+        self._tree = [0]
+        self._owner = {}
+        self._block_numbers = {}
+        self._len = 0
+        self.extend(items)
+
+    def __len__(self):
+        return self._len
+
+    def __bool__(self):
+        return self._len > 0
+
+    def __iter__(self):
+        for block in self._blocks:
+            yield from block
+
+    def __contains__(self, item):
+        return item in self._owner
+
+    def __repr__(self):
+        return f"IndexedQueue({list(self)!r})"
+
+    def _rebuild(self):
+        # Only needed when blocks split, merge or disappear
+        tree = [0] * (len(self._blocks) + 1)
+        for i, block in enumerate(self._blocks, 1):
+            tree[i] += len(block)
+            parent = i + (i & -i)
+            if parent < len(tree):
+                tree[parent] += tree[i]
+        self._tree = tree
+        self._block_numbers = {id(block): i for i, block in enumerate(self._blocks)}
+
+    def _adjust(self, block_index, delta):
+        tree = self._tree
+        i = block_index + 1
+        while i < len(tree):
+            tree[i] += delta
+            i += i & -i
+
+    def _prefix(self, block_index):
+        tree = self._tree
+        total = 0
+        i = block_index
+        while i > 0:
+            total += tree[i]
+            i -= i & -i
+        return total
+
+    def _locate(self, index):
+        """Block number and offset of a position, found by descending the Fenwick tree"""
+        tree = self._tree
+        pos = 0
+        step = 1 << (len(tree) - 1).bit_length() >> 1
+        while step:
+            nxt = pos + step
+            if nxt < len(tree) and tree[nxt] <= index:
+                pos = nxt
+                index -= tree[nxt]
+            step >>= 1
+        return pos, index
+
+    def _check(self, index):
+        if index < 0:
+            index += self._len
+        if not 0 <= index < self._len:
+            raise IndexError("IndexedQueue index out of range")
+        return index
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(self._len)
+            if step != 1:
+                return list(self)[index]
+            return self.page(start, stop)
+        
+        block, offset = self._locate(self._check(index))
+        return self._blocks[block][offset]
+
+    def __delitem__(self, index):
+        self.pop(index)
+
+    def page(self, start, stop):
+        """Items in [start, stop) without walking the rest of the queue"""
+        start, stop = max(0, start), min(stop, self._len)
+        items = []
+        if start >= stop:
+            return items
+        
+        block, offset = self._locate(start)
+        needed = stop - start
+        while needed > 0:
+            chunk = self._blocks[block][offset:offset + needed]
+            items.extend(chunk)
+            needed -= len(chunk)
+            block += 1
+            offset = 0
+        return items
+
+    def insert(self, index, item):
+        if index < 0:
+            index = max(0, index + self._len)
+        index = min(index, self._len)
+        
+        if not self._blocks:
+            self._blocks.append([item])
+            self._owner[item] = self._blocks[0]
+            self._len = 1
+            self._rebuild()
+            return
+        
+        if index == self._len:
+            block = len(self._blocks) - 1
+            self._blocks[block].append(item)
+        else:
+            block, offset = self._locate(index)
+            self._blocks[block].insert(offset, item)
         
-        hours, remainder = divmod(int(self.duration), 3600)
-        minutes, seconds = divmod(remainder, 60)
+        self._owner[item] = self._blocks[block]
+        self._len += 1
+        if len(self._blocks[block]) > 2 * self.LOAD:
+            items = self._blocks[block]
+            halves = [items[:self.LOAD], items[self.LOAD:]]
+            self._blocks[block:block + 1] = halves
+            for half in halves:
+                for moved in half:
+                    self._owner[moved] = half
+            self._rebuild()
+        else:
+            self._adjust(block, 1)
+
+    def pop(self, index=-1):
+        block, offset = self._locate(self._check(index))
+        items = self._blocks[block]
+        item = items.pop(offset)
+        self._owner.pop(item, None)
+        self._len -= 1
         
-        if hours > 0:
-            return f"{hours:02d}:{minutes:02d}:{seconds:02d}"
-        return f"{minutes:02d}:{seconds:02d}"
+        if not items:
+            del self._blocks[block]
+            self._rebuild()
+        elif (len(items) < self.LOAD // 4 and block + 1 < len(self._blocks)
+                and len(items) + len(self._blocks[block + 1]) <= self.LOAD):
+            absorbed = self._blocks.pop(block + 1)
+            items.extend(absorbed)
+            for moved in absorbed:
+                self._owner[moved] = items
+            self._rebuild()
+        else:
+            self._adjust(block, -1)
+        return item
+
+    def append(self, item):
+        self.insert(self._len, item)
+
+    def appendleft(self, item):
+        self.insert(0, item)
+
+    def popleft(self):
+        return self.pop(0)
+
+    def extend(self, items):
+        blocks = self._blocks
+        for item in items:
+            if not blocks or len(blocks[-1]) >= self.LOAD:
+                blocks.append([])
+            blocks[-1].append(item)
+            self._owner[item] = blocks[-1]
+            self._len += 1
+        self._rebuild()
+
+    def index(self, item):
+        block = self._owner.get(item)
+        if block is None:
+            raise ValueError("item is not in the queue")
+        return self._prefix(self._block_numbers[id(block)]) + block.index(item)
+
+    def remove(self, item):
+        return self.pop(self.index(item))
+
+    def move(self, from_pos, to_pos):
+        item = self.pop(from_pos)
+        self.insert(to_pos, item)
+        return item
+
+    def clear(self):
+        self._blocks = []
+        self._tree = [0]
+        self._owner = {}
+        self._block_numbers = {}
+        self._len = 0
 
 # ═══════════════════════════════════════════════════════════════════════════════
 #                              MUSIC QUEUE CLASS
 # ═══════════════════════════════════════════════════════════════════════════════
 
+class Prefetcher:
+    """Resolves the next track's stream in the background while the current one plays"""
+    
+    def __init__(self, guild_id):
+        self.guild_id = guild_id
+        self.track = None
+        self.task = None
+
+    def schedule(self, track):
+        """Point the prefetch at a new target; an unchanged target is left alone"""
+        if track is self.track:
+            return
+        
+        self.track = track
+        self.task = None
+        if track is not None and track.webpage_url not in audio_cache:
+            self.task = asyncio.ensure_future(resolve_stream(track.webpage_url, guild_id=self.guild_id))
+            self.task.add_done_callback(self._log_failure)
+
+    def invalidate(self):
+        self.track = None
+        self.task = None
+
+    async def wait(self, track):
+        """Join an in-flight prefetch for this track instead of extracting it twice"""
+        if track is self.track and self.task and not self.task.done():
+            try:
+                await asyncio.shield(self.task)
+            except Exception:
+                pass
+
+    @staticmethod
+    def _log_failure(task):
+        if not task.cancelled() and task.exception():
+            logger.warning(f"Prefetch failed: {task.exception()}")
+
+
+class ShuffleOrder:
+    """Persistent shuffled play order over the queued tracks
+
+    Each track gets a random sort key and plays in ascending key order, so an
+    insert lands at a random point and a removal leaves the rest of the order as
+    it was. Keys come from a seedable RNG; stale heap entries are skipped lazily.
+    """
+    
+    def __init__(self, seed=None):
+        self.seed = seed
+        self._rng = random.Random(seed)
+        self._keys = {}
+        self._heap = []
+        self._seq = itertools.count()
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __contains__(self, track):
+        return track in self._keys
+
+    def _push(self, track, key):
+        self._keys[track] = key
+        heapq.heappush(self._heap, (key, next(self._seq), track))
+
+    def reset(self, tracks=(), seed=None):
+        """Re-seed and draw a fresh permutation over tracks"""
+        self.seed = seed
+        self._rng = random.Random(seed)
+        self.reshuffle(tracks)
+
+    def reshuffle(self, tracks):
+        """Draw the next permutation from the running RNG, so a seeded loop still varies per cycle"""
+        self._keys = {}
+        self._heap = []
+        for track in tracks:
+            key = self._rng.random()
+            self._keys[track] = key
+            self._heap.append((key, next(self._seq), track))
+        heapq.heapify(self._heap)
+
+    def add(self, track):
+        self._push(track, self._rng.random())
+
+    def discard(self, track):
+        if self._keys.pop(track, None) is not None and len(self._heap) > 2 * len(self._keys) + 64:
+            self._heap = [entry for entry in self._heap if self._keys.get(entry[2]) == entry[0]]
+            heapq.heapify(self._heap)
+
+    def promote(self, track):
+        """Move a track to the front of the order"""
+        first = self.peek()
+        self._push(track, (self._keys[first] if first is not None else 0.0) - 1.0)
+
+    def defer(self, track):
+        """Move a track to the back of the order"""
+        self._push(track, 1.0 + self._rng.random())
+
+    def peek(self):
+        heap = self._heap
+        while heap:
+            key, _, track = heap[0]
+            if self._keys.get(track) == key:
+                return track
+            heapq.heappop(heap)
+        return None
+
+    def pop(self):
+        track = self.peek()
+        if track is not None:
+            self.discard(track)
+        return track
+
+    def upcoming(self, count):
+        """Next few tracks in play order, walking the heap's tree from the root without touching it"""
+        heap = self._heap
+        frontier = [(heap[0], 0)] if heap else []
+        tracks = []
+        while frontier and len(tracks) < count:
+            (key, _, track), index = heapq.heappop(frontier)
+            if self._keys.get(track) == key:
+                tracks.append(track)
+            for child in (2 * index + 1, 2 * index + 2):
+                if child < len(heap):
+                    heapq.heappush(frontier, (heap[child], child))
+        return tracks
+
+
 class MusicQueue:
     """Advanced music queue with all features"""
     
     def __init__(self, guild_id):
         self.guild_id = guild_id
-        self.queue = deque()
-        self.history = deque(maxlen=100)
+        self.queue = IndexedQueue()
+        self.history = deque(maxlen=QUEUE_HISTORY_SIZE)
         self.current = None
         self.loop_mode = 'off'
         self.shuffle_enabled = False
         self.volume = 50
         self.play_count = 0
-        self.original_queue = deque()
+        # Ordered set of every track in a looped queue
+        self.original_queue = {}
         self.audio_filter = 'normal'
         self.votes_skip = set()
         self.skip_threshold = 0.5
         self.last_activity = time.time()
         self.now_playing_message = None
         self.text_channel = None
+        self.prefetcher = Prefetcher(guild_id)
+        self.shuffle_order = ShuffleOrder()
+        self.gapless = False
+        self.crossfade = 0
+        self.effects = ()
+        self.normalize = False
+        self.transition = None
+        self.stream_retry = None
 
     def add(self, item):
         self.queue.append(item)
+        if self.shuffle_enabled:
+            self.shuffle_order.add(item)
         self.last_activity = time.time()
+        self.refresh_prefetch()
 
     def add_next(self, item):
         self.queue.appendleft(item)
+        if self.shuffle_enabled:
+            self.shuffle_order.add(item)
         self.last_activity = time.time()
+        self.refresh_prefetch()
 
     def add_playlist(self, items):
         self.queue.extend(items)
+        if self.shuffle_enabled:
+            for item in items:
+                self.shuffle_order.add(item)
         self.last_activity = time.time()
+        self.refresh_prefetch()
+
+    def peek_next(self):
+        """Track that next() will return"""
+        if self.loop_mode == 'song' and self.current:
+            return self.current
+        
+        if self.queue:
+            return self.shuffle_order.peek() if self.shuffle_enabled else self.queue[0]
+        
+        if self.loop_mode == 'queue' and self.original_queue and not self.shuffle_enabled:
+            return next(iter(self.original_queue))
+        return None
+
+    def upcoming(self, count):
+        """Next few queued tracks in play order"""
+        if self.shuffle_enabled:
+            return self.shuffle_order.upcoming(count)
+        return self.queue.page(0, count)
+
+    def start_queue_loop(self):
+        self.original_queue = dict.fromkeys(self.queue)
+        if self.current:
+            self.original_queue = {self.current: None, **self.original_queue}
+
+    def stop_queue_loop(self):
+        self.original_queue.clear()
+
+    def refresh_prefetch(self):
+        """Re-target the prefetcher (and the gapless pipeline) after the queue changed"""
+        target = self.peek_next() if self.current else None
+        self.prefetcher.schedule(target)
+        if self.transition is not None:
+            self.transition.schedule(target if self.gapless else None)
 
     def next(self):
         self.votes_skip.clear()
@@ -194,22 +2411,24 @@ class MusicQueue:
             return self.current
         
         if self.current and self.loop_mode != 'song':
-            self.history.append(self.current)
+            self.history.append(self.current.trimmed())
         
         if not self.queue and self.loop_mode == 'queue' and self.original_queue:
-            self.queue = deque(self.original_queue)
+            self.queue = IndexedQueue(self.original_queue)
+            if self.shuffle_enabled:
+                # New cycle, new permutation: nothing repeats until the whole queue has played
+                self.shuffle_order.reshuffle(self.queue)
+                if len(self.queue) > 1 and self.shuffle_order.peek() is self.current:
+                    self.shuffle_order.defer(self.current)
         
         if self.queue:
             if self.shuffle_enabled:
-                index = random.randint(0, len(self.queue) - 1)
-                self.current = list(self.queue)[index]
-                del self.queue[index]
+                self.current = self.queue.remove(self.shuffle_order.pop())
             else:
                 self.current = self.queue.popleft()
             
             if self.loop_mode == 'queue' and self.current:
-                if self.current not in self.original_queue:
-                    self.original_queue.append(self.current)
+                self.original_queue.setdefault(self.current)
             
             self.play_count += 1
             self.last_activity = time.time()
@@ -222,9 +2441,14 @@ class MusicQueue:
     def previous(self):
         if self.history:
             if self.current:
+                if self.current in self.queue:
+                    self.queue.remove(self.current)
                 self.queue.appendleft(self.current)
+                if self.shuffle_enabled:
+                    self.shuffle_order.promote(self.current)
             self.current = self.history.pop()
             self.last_activity = time.time()
+            self.refresh_prefetch()
             return self.current
         return None
 
@@ -233,20 +2457,30 @@ class MusicQueue:
         self.original_queue.clear()
         self.current = None
         self.votes_skip.clear()
+        self.shuffle_order.reset(seed=self.shuffle_order.seed)
+        self.prefetcher.invalidate()
+
+    def clear_upcoming(self):
+        """Drop queued tracks but keep the current one playing"""
+        cleared = len(self.queue)
+        self.queue.clear()
+        self.original_queue.clear()
+        self.shuffle_order.reset(seed=self.shuffle_order.seed)
+        self.refresh_prefetch()
+        return cleared
 
     def remove(self, index):
         if 0 <= index < len(self.queue):
-            removed = list(self.queue)[index]
-            del self.queue[index]
+            removed = self.queue.pop(index)
+            self.shuffle_order.discard(removed)
+            self.refresh_prefetch()
             return removed
         return None
 
     def move(self, from_pos, to_pos):
         if 0 <= from_pos < len(self.queue) and 0 <= to_pos < len(self.queue):
-            queue_list = list(self.queue)
-            song = queue_list.pop(from_pos)
-            queue_list.insert(to_pos, song)
-            self.queue = deque(queue_list)
+            song = self.queue.move(from_pos, to_pos)
+            self.refresh_prefetch()
             return song
         return None
 
@@ -254,26 +2488,216 @@ class MusicQueue:
         if 0 <= index < len(self.queue):
             for _ in range(index):
                 skipped = self.queue.popleft()
-                self.history.append(skipped)
+                self.shuffle_order.discard(skipped)
+                self.history.append(skipped.trimmed())
+            # skipto always lands on the chosen track, even in shuffle mode
+            if self.shuffle_enabled and self.queue:
+                self.shuffle_order.promote(self.queue[0])
+            self.refresh_prefetch()
             return self.queue[0] if self.queue else None
         return None
 
+    def _retain(self, keep, drop_played=None):
+        """Rebuild the queue in one pass, keeping tracks where keep(position, track) is true"""
+        kept = []
+        removed = set()
+        for position, track in enumerate(self.queue):
+            if keep(position, track):
+                kept.append(track)
+            else:
+                self.shuffle_order.discard(track)
+                removed.add(track)
+        if removed:
+            self.queue = IndexedQueue(kept)
+        self._sync_loop(removed, drop_played)
+        if removed:
+            self.refresh_prefetch()
+        return len(removed)
+
+    def _sync_loop(self, removed=(), drop_played=None):
+        """Rebuild the loop cycle after an edit: tracks already played this cycle (minus removed ones
+        and drop_played(track) rejects), the current track, then the queue as it now stands"""
+        if not self.original_queue:
+            return
+        
+        upcoming = set(self.queue)
+        played = [
+            track for track in self.original_queue
+            if track is not self.current and track not in upcoming and track not in removed
+            and not (drop_played and drop_played(track))
+        ]
+        current = [self.current] if self.current in self.original_queue else []
+        self.original_queue = dict.fromkeys(itertools.chain(played, current, self.queue))
+
+    def remove_range(self, start, end):
+        """Remove positions start..end (0-based, inclusive)"""
+        return self._retain(lambda position, track: not start <= position <= end)
+
+    def remove_by_requester(self, user_id):
+        requested = lambda track: bool(track.requester and track.requester.id == user_id)
+        return self._retain(lambda position, track: not requested(track), requested)
+
+    def dedupe(self):
+        """Keep the first copy of every URL, counting the current track as already queued"""
+        seen = {self.current.webpage_url} if self.current else set()
+        
+        def keep(position, track):
+            if track.webpage_url in seen:
+                return False
+            seen.add(track.webpage_url)
+            return True
+        
+        # Runs after the queue pass, so copies already played this cycle lose to the queued ones
+        return self._retain(keep, lambda track: not keep(None, track))
+
+    def remove_longer_than(self, seconds):
+        too_long = lambda track: bool(track.duration and track.duration > seconds)
+        return self._retain(lambda position, track: not too_long(track), too_long)
+
+    def reverse(self):
+        self.queue = IndexedQueue(reversed(list(self.queue)))
+        self._sync_loop()
+        self.refresh_prefetch()
+
+    def toggle_shuffle(self):
+        return self.set_shuffle(not self.shuffle_enabled)
+
+    def set_shuffle(self, enabled, seed=None):
+        """Turn shuffle on with a fresh (optionally seeded) permutation, or off"""
+        self.shuffle_enabled = enabled
+        self.shuffle_order.reset(self.queue if enabled else (), seed)
+        self.refresh_prefetch()
+        return self.shuffle_enabled
+
     def is_empty(self):
         return len(self.queue) == 0
 
-    def get_queue_list(self):
-        return list(self.queue)
+    def get_queue_list(self):
+        return list(self.queue)
+
+    def page(self, start, end):
+        return self.queue.page(start, end)
+
+    def total_duration(self):
+        total = sum(song.duration or 0 for song in self.queue)
+        if self.current and self.current.duration:
+            total += self.current.duration
+        return total
+
+    def snapshot(self):
+        """JSON-safe state for spilling an idle queue; the interrupted current track goes first"""
+        tracks = ([self.current] if self.current else []) + list(self.queue)
+        return {
+            'settings': {
+                'volume': self.volume,
+                'loop_mode': self.loop_mode,
+                'shuffle': self.shuffle_enabled,
+                'seed': self.shuffle_order.seed,
+                'audio_filter': self.audio_filter,
+                'skip_threshold': self.skip_threshold,
+                'gapless': self.gapless,
+                'crossfade': self.crossfade,
+                'effects': list(self.effects),
+                'normalize': self.normalize,
+            },
+            'queue': [track.to_record() for track in tracks],
+            'history': [track.to_record() for track in self.history],
+        }
+
+    def restore(self, state):
+        """Merge a spilled snapshot in: its tracks queue behind anything added since, its history goes first"""
+        settings = state['settings']
+        self.volume = settings['volume']
+        self.audio_filter = settings['audio_filter']
+        self.skip_threshold = settings['skip_threshold']
+        self.gapless = settings['gapless']
+        self.crossfade = settings['crossfade']
+        self.effects = tuple(settings['effects'])
+        self.normalize = settings['normalize']
+        
+        history = [QueuedTrack.from_record(record) for record in state['history']]
+        self.history = deque(history + list(self.history), maxlen=QUEUE_HISTORY_SIZE)
+        self.add_playlist([QueuedTrack.from_record(record) for record in state['queue']])
+        
+        self.loop_mode = settings['loop_mode']
+        if self.loop_mode == 'queue':
+            self.start_queue_loop()
+        if settings['shuffle']:
+            self.set_shuffle(True, settings['seed'])
+
+
+class QueueRegistry:
+    """Live MusicQueues for active guilds; idle ones are dropped, or spilled to SQLite with QUEUE_SPILL"""
+    
+    def __init__(self, queues, idle_ttl=QUEUE_IDLE_TTL, spill=QUEUE_SPILL):
+        self.queues = queues
+        self.idle_ttl = idle_ttl
+        self.spill = spill
+        self.spilled = set()
+        self.evicted = 0
+        self.restored = 0
+
+    def get(self, guild_id):
+        queue = self.queues.get(guild_id)
+        if queue is None:
+            queue = self.queues[guild_id] = MusicQueue(guild_id)
+            if guild_id in self.spilled:
+                self.spilled.discard(guild_id)
+                asyncio.ensure_future(self._restore(queue))
+        return queue
+
+    def idle(self):
+        """Guilds without a voice connection whose queue hasn't been touched for idle_ttl"""
+        cutoff = time.time() - self.idle_ttl
+        for guild_id, queue in list(self.queues.items()):
+            guild = bot.get_guild(guild_id)
+            if queue.last_activity < cutoff and not (guild and guild.voice_client):
+                yield guild_id
+
+    async def evict(self, guild_id, *, spill=None):
+        queue = self.queues.pop(guild_id, None)
+        if queue is None:
+            return
+        
+        queue.prefetcher.invalidate()
+        now_playing_updater.forget(guild_id)
+        frame_cache.clear_guild(guild_id)
+        self.evicted += 1
+        
+        state = queue.snapshot()
+        keep = state['queue'] or state['history'] or state['settings'] != MusicQueue(guild_id).snapshot()['settings']
+        if (self.spill if spill is None else spill) and keep:
+            # Marked before the write is queued; the store's single worker keeps a restore behind it
+            self.spilled.add(guild_id)
+            try:
+                await metadata_store.save_queue_state(guild_id, state)
+            except sqlite3.Error as e:
+                self.spilled.discard(guild_id)
+                logger.error(f"Failed to spill queue for guild {guild_id}: {e}")
+
+    async def _restore(self, queue):
+        try:
+            state = await metadata_store.take_queue_state(queue.guild_id)
+        except (sqlite3.Error, ValueError) as e:
+            logger.error(f"Failed to restore queue for guild {queue.guild_id}: {e}")
+            return
+        if state is None or self.queues.get(queue.guild_id) is not queue:
+            return
+        
+        queue.restore(state)
+        self.restored += 1
+        guild = bot.get_guild(queue.guild_id)
+        if guild and guild.voice_client:
+            await apply_volume(guild)
+        await update_now_playing(queue.guild_id)
+
+    async def load(self):
+        self.spilled = {guild_id for guild_id in await metadata_store.load_spilled_guilds() if owns_guild(guild_id)}
 
-    def total_duration(self):
-        total = sum(song.duration or 0 for song in self.queue)
-        if self.current and self.current.duration:
-            total += self.current.duration
-        return total
+queue_registry = QueueRegistry(music_queues)
 
 def get_queue(guild_id):
-    if guild_id not in music_queues:
-        music_queues[guild_id] = MusicQueue(guild_id)
-    return music_queues[guild_id]
+    return queue_registry.get(guild_id)
 
 # ═══════════════════════════════════════════════════════════════════════════════
 #                              EMBED HELPERS
@@ -339,17 +2763,101 @@ def format_queue_duration(seconds):
 #                              UPDATE NOW PLAYING
 # ═══════════════════════════════════════════════════════════════════════════════
 
-async def update_now_playing(guild_id):
-    """Update the now playing message with current settings"""
-    queue = get_queue(guild_id)
-    if queue.now_playing_message and queue.current:
+class NowPlayingUpdater:
+    """Debounced now-playing edits: bursts collapse into one edit per interval, unchanged embeds are skipped
+
+    Edits also stay inside a per-channel sliding window (CHANNEL_EDIT_LIMIT per
+    CHANNEL_EDIT_WINDOW seconds) and back off after a 429.
+    """
+    
+    def __init__(self, interval=NOW_PLAYING_INTERVAL):
+        self.interval = interval
+        self._dirty = set()
+        self._tasks = {}
+        self._last_edit = {}
+        self._hashes = {}
+        self._channel_edits = {}
+        self._blocked_until = {}
+        self.edits = 0
+        self.skipped = 0
+
+    def request(self, guild_id):
+        """Mark a guild's now-playing message stale; the edit happens later with the latest state"""
+        self._dirty.add(guild_id)
+        if guild_id not in self._tasks:
+            self._tasks[guild_id] = asyncio.ensure_future(self._run(guild_id))
+
+    async def _run(self, guild_id):
+        try:
+            while guild_id in self._dirty:
+                await asyncio.sleep(max(0.0, self._last_edit.get(guild_id, 0) + self.interval - time.monotonic()))
+                # Never get_queue() here: an evicted guild (forget() cleared it) must not be recreated
+                queue = music_queues.get(guild_id)
+                message = queue.now_playing_message if queue is not None else None
+                if message is not None:
+                    await asyncio.sleep(self._channel_delay(message.channel.id))
+                if guild_id not in self._dirty or music_queues.get(guild_id) is not queue:
+                    return
+                # Anything requested while waiting is covered by this render
+                self._dirty.discard(guild_id)
+                if message is not None and queue.current and message is queue.now_playing_message:
+                    await self._edit(guild_id, queue, message)
+        finally:
+            self._tasks.pop(guild_id, None)
+
+    def forget(self, guild_id):
+        self._dirty.discard(guild_id)
+        self._last_edit.pop(guild_id, None)
+        self._hashes.pop(guild_id, None)
+
+    def _channel_delay(self, channel_id):
+        # Expired windows and blocks are swept out, so the maps only ever hold the
+        # channels edited (or blocked) within the last window
+        now = time.monotonic()
+        for channel, edits in list(self._channel_edits.items()):
+            while edits and edits[0] <= now - CHANNEL_EDIT_WINDOW:
+                edits.popleft()
+            if not edits:
+                del self._channel_edits[channel]
+        for channel, until in list(self._blocked_until.items()):
+            if until <= now:
+                del self._blocked_until[channel]
+        
+        edits = self._channel_edits.get(channel_id)
+        delay = self._blocked_until.get(channel_id, 0) - now
+        if edits and len(edits) >= CHANNEL_EDIT_LIMIT:
+            delay = max(delay, edits[0] + CHANNEL_EDIT_WINDOW - now)
+        return max(0.0, delay)
+
+    async def _edit(self, guild_id, queue, message):
+        embed = create_music_embed(queue.current, "Now Playing", queue)
+        digest = hash(json.dumps(embed.to_dict(), sort_keys=True))
+        if self._hashes.get(guild_id) == (message.id, digest):
+            self.skipped += 1
+            return
+        
+        self._last_edit[guild_id] = time.monotonic()
+        self._channel_edits.setdefault(message.channel.id, deque()).append(time.monotonic())
         try:
-            embed = create_music_embed(queue.current, "Now Playing", queue)
-            await queue.now_playing_message.edit(embed=embed)
+            await message.edit(embed=embed)
         except discord.NotFound:
             queue.now_playing_message = None
-        except discord.HTTPException:
-            pass
+            return
+        except discord.HTTPException as e:
+            if e.status == 429:
+                retry_after = getattr(e, 'retry_after', None) or CHANNEL_EDIT_WINDOW
+                self._blocked_until[message.channel.id] = time.monotonic() + retry_after
+                self._dirty.add(guild_id)
+            return
+        
+        self._hashes[guild_id] = (message.id, digest)
+        self.edits += 1
+
+now_playing_updater = NowPlayingUpdater()
+
+async def update_now_playing(guild_id):
+    """Schedule a refresh of the now playing message with current settings"""
+    now_playing_updater.request(guild_id)
 
 # ═══════════════════════════════════════════════════════════════════════════════
 #                              DJ PERMISSION CHECK
@@ -431,9 +2939,9 @@ class MusicControlView(discord.ui.View):
         queue = get_queue(self.guild_id)
         if queue.volume < 200:
             queue.volume = min(200, queue.volume + 10)
-            if interaction.guild.voice_client and interaction.guild.voice_client.source:
-                interaction.guild.voice_client.source.volume = queue.volume / 100
+            # Respond first: leaving passthrough rebuilds the pipeline, which can outlast the 3s deadline
             await interaction.response.send_message(f"Volume: {queue.volume}%", ephemeral=True)
+            await apply_volume(interaction.guild)
             await update_now_playing(self.guild_id)
         else:
             await interaction.response.send_message("Max volume!", ephemeral=True)
@@ -443,9 +2951,9 @@ class MusicControlView(discord.ui.View):
         queue = get_queue(self.guild_id)
         if queue.volume > 0:
             queue.volume = max(0, queue.volume - 10)
-            if interaction.guild.voice_client and interaction.guild.voice_client.source:
-                interaction.guild.voice_client.source.volume = queue.volume / 100
+            # Respond first: leaving passthrough rebuilds the pipeline, which can outlast the 3s deadline
             await interaction.response.send_message(f"Volume: {queue.volume}%", ephemeral=True)
+            await apply_volume(interaction.guild)
             await update_now_playing(self.guild_id)
         else:
             await interaction.response.send_message("Min volume!", ephemeral=True)
@@ -458,21 +2966,19 @@ class MusicControlView(discord.ui.View):
             await interaction.response.send_message("Looping current song", ephemeral=True)
         elif queue.loop_mode == 'song':
             queue.loop_mode = 'queue'
-            queue.original_queue = deque(queue.queue)
-            if queue.current:
-                queue.original_queue.appendleft(queue.current)
+            queue.start_queue_loop()
             await interaction.response.send_message("Looping queue", ephemeral=True)
         else:
             queue.loop_mode = 'off'
-            queue.original_queue.clear()
+            queue.stop_queue_loop()
             await interaction.response.send_message("Loop disabled", ephemeral=True)
+        queue.refresh_prefetch()
         await update_now_playing(self.guild_id)
 
     @discord.ui.button(label="Shuffle", style=discord.ButtonStyle.secondary, custom_id="shuffle")
     async def shuffle(self, interaction: discord.Interaction, button: discord.ui.Button):
         queue = get_queue(self.guild_id)
-        queue.shuffle_enabled = not queue.shuffle_enabled
-        status = "ON" if queue.shuffle_enabled else "OFF"
+        status = "ON" if queue.toggle_shuffle() else "OFF"
         await interaction.response.send_message(f"Shuffle: {status}", ephemeral=True)
         await update_now_playing(self.guild_id)
 
@@ -526,14 +3032,8 @@ class SearchSelectMenu(discord.ui.Select):
         try:
             queue = get_queue(interaction.guild_id)
             queue.text_channel = interaction.channel
-            player = await YTDLSource.from_url(
-                selected['url'],
-                loop=bot.loop,
-                stream=True,
-                requester=interaction.user,
-                audio_filter=queue.audio_filter
-            )
-            player.volume = queue.volume / 100
+            data = await resolve_stream(selected['url'], guild_id=interaction.guild_id)
+            player = QueuedTrack.from_data(data, requester=interaction.user)
             
             if interaction.guild.voice_client.is_playing() or interaction.guild.voice_client.is_paused():
                 queue.add(player)
@@ -542,11 +3042,7 @@ class SearchSelectMenu(discord.ui.Select):
                 await interaction.followup.send(embed=embed)
             else:
                 queue.current = player
-                interaction.guild.voice_client.play(
-                    player,
-                    after=lambda e: asyncio.run_coroutine_threadsafe(play_next(interaction.guild_id), bot.loop)
-                )
-                bot_stats['songs_played'] += 1
+                await play_track(interaction.guild, player, data=data)
                 embed = create_music_embed(player, "Now Playing", queue)
                 msg = await interaction.followup.send(embed=embed, view=MusicControlView(interaction.guild_id))
                 queue.now_playing_message = msg
@@ -572,14 +3068,41 @@ async def on_ready():
     ╠════════════════════════════════════════════════════════╣
     ║  Bot: {bot.user.name:<46} ║
     ║  Servers: {len(bot.guilds):<42} ║
-    ║  Users: {len(set(bot.get_all_members())):<44} ║
+    ║  Users: {user_count():<44} ║
     ║  Latency: {round(bot.latency * 1000)}ms{' ' * 40}║
     ╚════════════════════════════════════════════════════════╝
     ''')
     
     bot_stats['servers'] = len(bot.guilds)
+    
+    for state in (music_queues, dj_roles, mode_247):
+        state.rebalance()
+    
+    try:
+        for guild_id, dj_role_id, enabled in await metadata_store.load_guild_settings():
+            if not owns_guild(guild_id):
+                continue
+            if dj_role_id:
+                dj_roles[guild_id] = dj_role_id
+            if enabled:
+                mode_247[guild_id] = True
+    except sqlite3.Error as e:
+        logger.error(f"Failed to load guild settings: {e}")
+    
+    try:
+        audio_cache.load()
+    except OSError as e:
+        logger.error(f"Failed to load audio cache: {e}")
+    
+    try:
+        await queue_registry.load()
+    except sqlite3.Error as e:
+        logger.error(f"Failed to load spilled queues: {e}")
+    
     change_status.start()
     check_voice_activity.start()
+    evict_idle_queues.start()
+    refresh_streams.start()
     
     try:
         synced = await bot.tree.sync()
@@ -587,6 +3110,23 @@ async def on_ready():
     except Exception as e:
         print(f"Failed to sync commands: {e}")
 
+@bot.event
+async def on_shard_ready(shard_id):
+    guilds = sum(1 for guild in bot.guilds if guild.shard_id == shard_id)
+    logger.info(f"Shard {shard_id} ready with {guilds} guilds")
+
+@bot.event
+async def on_guild_remove(guild):
+    await queue_registry.evict(guild.id, spill=False)
+
+@bot.event
+async def on_message(message):
+    if PREFIX_COMMANDS == 'off' or message.author.bot:
+        return
+    if PREFIX_COMMANDS == 'channels' and message.channel.id not in PREFIX_CHANNELS:
+        return
+    await bot.process_commands(message)
+
 @bot.event
 async def on_command(ctx):
     bot_stats['commands_used'] += 1
@@ -602,6 +3142,8 @@ async def on_voice_state_update(member, before, after):
                     await before.channel.connect()
                 except:
                     pass
+            else:
+                frame_cache.clear_guild(guild_id)
 
 # ═══════════════════════════════════════════════════════════════════════════════
 #                              STATUS ROTATION
@@ -639,11 +3181,202 @@ async def check_voice_activity():
             queue.clear()
             await vc.disconnect()
 
+@tasks.loop(minutes=5)
+async def evict_idle_queues():
+    for guild_id in list(queue_registry.idle()):
+        await queue_registry.evict(guild_id)
+
+@tasks.loop(seconds=STREAM_REFRESH_INTERVAL)
+async def refresh_streams():
+    """Re-resolve stream URLs of queued and paused tracks shortly before they expire"""
+    deadline = time.time() + STREAM_EXPIRY_MARGIN + STREAM_REFRESH_WINDOW
+    
+    due = []
+    for guild_id, queue in list(music_queues.items()):
+        for track in itertools.chain((queue.current,), queue.queue):
+            if track is None or track.webpage_url in audio_cache:
+                continue
+            expires_at = stream_cache.expires_at(track.webpage_url)
+            if expires_at is not None and expires_at <= deadline:
+                due.append((expires_at, guild_id, track.webpage_url))
+    
+    # Soonest first, a few per guild, and one global batch per tick across all guilds
+    due.sort()
+    batch = {}
+    per_guild = {}
+    for _, guild_id, url in due:
+        if url in batch or per_guild.get(guild_id, 0) >= STREAM_REFRESH_PER_GUILD:
+            continue
+        batch[url] = guild_id
+        per_guild[guild_id] = per_guild.get(guild_id, 0) + 1
+        if len(batch) >= STREAM_REFRESH_BATCH:
+            break
+    
+    results = await asyncio.gather(
+        *(refresh_stream(url, guild_id=guild_id) for url, guild_id in batch.items()),
+        return_exceptions=True
+    )
+    for url, result in zip(batch, results):
+        if isinstance(result, Exception):
+            logger.warning(f"Stream refresh failed for {url}: {result}")
+    
+    # A paused ffmpeg still holds the old URL and reconnects with it on resume, so rebuild it
+    for vc in list(bot.voice_clients):
+        source = vc.source
+        if not vc.is_paused() or source is None:
+            continue
+        data = getattr(source.current if isinstance(source, GaplessSource) else source, 'data', None)
+        if not data or data.get('local') or stream_expiry(data.get('url')) > deadline:
+            continue
+        
+        try:
+            queue = get_queue(vc.guild.id)
+            if queue.current and (stream_cache.expires_at(queue.current.webpage_url) or 0) <= deadline:
+                await refresh_stream(queue.current.webpage_url, guild_id=vc.guild.id)
+            await restart_current(vc.guild)
+            logger.info(f"Rebuilt paused source in guild {vc.guild.id} ahead of URL expiry")
+        except Exception as e:
+            logger.warning(f"Failed to refresh paused source in guild {vc.guild.id}: {e}")
+
 # ═══════════════════════════════════════════════════════════════════════════════
 #                              PLAY NEXT HANDLER
 # ═══════════════════════════════════════════════════════════════════════════════
 
-async def play_next(guild_id):
+async def play_track(guild, track, *, data=None):
+    """Build the ffmpeg source for a queued track and start it on the voice client"""
+    queue = get_queue(guild.id)
+    await queue.prefetcher.wait(track)
+    source = await track.create_source(
+        data=data,
+        volume=queue.volume / 100,
+        audio_filter=queue.audio_filter,
+        guild_id=guild.id,
+        pcm=queue.gapless
+    )
+    
+    queue.transition = None
+    if queue.gapless:
+        source = queue.transition = GaplessSource(guild.id, source, track, crossfade=queue.crossfade)
+    
+    if guild.voice_client.is_playing() or guild.voice_client.is_paused():
+        guild.voice_client.stop()
+    
+    guild.voice_client.play(
+        source,
+        after=lambda e: asyncio.run_coroutine_threadsafe(play_next(guild.id, failed=stream_failed(source, e)), bot.loop)
+    )
+    bot_stats['songs_played'] += 1
+    audio_cache.note_play(track)
+    queue.refresh_prefetch()
+    analyze_loudness(queue, track)
+    return source
+
+def stream_failed(source, error):
+    """Whether a finished source died on its stream URL: an error, or EOF within the first second
+
+    A stop() (skip) never reads EOF, so it doesn't count.
+    """
+    if error is not None:
+        return True
+    inner = source.current if isinstance(source, GaplessSource) else source
+    return getattr(inner, 'ended', False) and inner.frames < STREAM_FAIL_FRAMES
+
+def analyze_loudness(queue, track):
+    """Measure the playing and the upcoming track in the background when the guild will use the gain"""
+    if queue.normalize or queue.audio_filter in DYNAUDNORM_FILTERS:
+        for candidate in (track, queue.peek_next()):
+            if candidate is not None:
+                loudness.analyze(candidate, queue.audio_filter, guild_id=queue.guild_id)
+
+def playback_position(guild):
+    """Seconds into the current track for a guild, or 0 when nothing is playing"""
+    source = guild.voice_client.source if guild.voice_client else None
+    return getattr(source, 'position', 0)
+
+def swap_source(vc, source):
+    """Replace the playing source in place
+
+    VoiceClient.play() only creates an encoder when the first source is PCM, so a connection
+    that started on Opus (passthrough, cached or self-encoding recording sources) gets one here.
+    """
+    if not source.is_opus() and not vc.encoder:
+        vc.encoder = discord.opus.Encoder()
+    vc.source = source
+
+async def restart_current(guild, *, start_at=None):
+    """Rebuild the playing track's pipeline at its current position (or start_at) and swap it in place"""
+    queue = get_queue(guild.id)
+    vc = guild.voice_client
+    old_source = vc.source if vc else None
+    if not queue.current or old_source is None:
+        return None
+    
+    gapless = isinstance(old_source, GaplessSource)
+    new_source = await queue.current.create_source(
+        volume=queue.volume / 100,
+        audio_filter=queue.audio_filter,
+        guild_id=guild.id,
+        start_at=playback_position(guild) if start_at is None else start_at,
+        pcm=gapless
+    )
+    
+    if gapless:
+        old_source.replace(new_source)
+        queue.refresh_prefetch()
+        return old_source
+    
+    # Swapping the source keeps the player (and its after callback) running, so play_next isn't triggered
+    paused = vc.is_paused()
+    swap_source(vc, new_source)
+    if paused:
+        vc.pause()
+    old_source.cleanup()
+    return new_source
+
+async def apply_volume(guild):
+    """Push the queue volume to the playing source, leaving Opus passthrough if it no longer fits"""
+    queue = get_queue(guild.id)
+    source = guild.voice_client.source if guild.voice_client else None
+    if source is None:
+        return
+    
+    if isinstance(source, (YTDLOpusSource, CachedOpusSource)):
+        if queue.volume / 100 != source.volume:
+            try:
+                await restart_current(guild)
+            except Exception as e:
+                logger.error(f"Failed to switch to PCM playback for volume change: {e}")
+    else:
+        if source.recorder is not None:
+            source.recorder.abort()
+        source.volume = queue.volume / 100
+
+async def gapless_advance(guild_id, track):
+    """Queue bookkeeping after a GaplessSource switched to the pre-warmed track"""
+    queue = get_queue(guild_id)
+    guild = bot.get_guild(guild_id)
+    if not guild or not guild.voice_client:
+        return
+    
+    next_song = queue.next()
+    if next_song is not track:
+        # The queue changed under the switch; fall back to a normal start of the real next track
+        if next_song:
+            await play_track(guild, next_song)
+        else:
+            guild.voice_client.stop()
+        return
+    
+    bot_stats['songs_played'] += 1
+    audio_cache.note_play(track)
+    queue.refresh_prefetch()
+    analyze_loudness(queue, track)
+    
+    if queue.text_channel and queue.loop_mode != 'song':
+        embed = create_music_embed(track, "Now Playing", queue)
+        queue.now_playing_message = await queue.text_channel.send(embed=embed, view=MusicControlView(guild_id))
+
+async def play_next(guild_id, *, failed=False):
     """Handle playing the next song in queue"""
     queue = get_queue(guild_id)
     guild = bot.get_guild(guild_id)
@@ -651,16 +3384,29 @@ async def play_next(guild_id):
     if not guild or not guild.voice_client:
         return
     
+    # A replaced source (replay, filter change) already started its successor
+    if guild.voice_client.is_playing() or guild.voice_client.is_paused():
+        return
+    
+    started = time.monotonic()
+    
+    # A cached URL can die before its expire time (403, IP-bound, throttled): drop it and re-resolve once
+    if failed and queue.current and queue.stream_retry is not queue.current:
+        queue.stream_retry = queue.current
+        stream_cache.invalidate(queue.current.webpage_url)
+        logger.warning(f"Stream for {queue.current.webpage_url} failed early in guild {guild_id}, re-resolving")
+        try:
+            await play_track(guild, queue.current)
+            return
+        except Exception as e:
+            logger.error(f"Retrying failed stream: {e}")
+    elif not failed:
+        queue.stream_retry = None
+    
     if queue.loop_mode == 'song' and queue.current:
         try:
-            new_source = await queue.current.recreate()
-            new_source.requester = queue.current.requester
-            new_source.volume = queue.volume / 100
-            guild.voice_client.play(
-                new_source,
-                after=lambda e: asyncio.run_coroutine_threadsafe(play_next(guild_id), bot.loop)
-            )
-            bot_stats['songs_played'] += 1
+            await play_track(guild, queue.current)
+            logger.debug(f"Loop restart in guild {guild_id} took {(time.monotonic() - started) * 1000:.0f}ms")
             return
         except Exception as e:
             logger.error(f"Error in song loop: {e}")
@@ -669,14 +3415,8 @@ async def play_next(guild_id):
     
     if next_song:
         try:
-            new_source = await next_song.recreate()
-            new_source.requester = next_song.requester
-            new_source.volume = queue.volume / 100
-            guild.voice_client.play(
-                new_source,
-                after=lambda e: asyncio.run_coroutine_threadsafe(play_next(guild_id), bot.loop)
-            )
-            bot_stats['songs_played'] += 1
+            await play_track(guild, next_song)
+            logger.debug(f"Track transition in guild {guild_id} took {(time.monotonic() - started) * 1000:.0f}ms")
             
             if queue.text_channel:
                 embed = create_music_embed(next_song, "Now Playing", queue)
@@ -705,32 +3445,20 @@ async def play_slash(interaction: discord.Interaction, query: str):
         await interaction.user.voice.channel.connect()
     
     try:
-        if not query.startswith('http'):
-            query = f'ytsearch:{query}'
-        
         queue = get_queue(interaction.guild_id)
         queue.text_channel = interaction.channel
-        player = await YTDLSource.from_url(
-            query,
-            loop=bot.loop,
-            stream=True,
-            requester=interaction.user,
-            audio_filter=queue.audio_filter
-        )
-        player.volume = queue.volume / 100
+        busy = interaction.guild.voice_client.is_playing() or interaction.guild.voice_client.is_paused()
+        data = await fetch_track_data(query, guild_id=interaction.guild_id, metadata_only=busy)
+        player = QueuedTrack.from_data(data, requester=interaction.user)
         
-        if interaction.guild.voice_client.is_playing() or interaction.guild.voice_client.is_paused():
+        if busy:
             queue.add(player)
             embed = create_music_embed(player, "Added to Queue", queue)
             embed.add_field(name="Position", value=f"`#{len(queue.queue)}`", inline=True)
             await interaction.followup.send(embed=embed)
         else:
             queue.current = player
-            interaction.guild.voice_client.play(
-                player,
-                after=lambda e: asyncio.run_coroutine_threadsafe(play_next(interaction.guild_id), bot.loop)
-            )
-            bot_stats['songs_played'] += 1
+            await play_track(interaction.guild, player, data=data)
             embed = create_music_embed(player, "Now Playing", queue)
             msg = await interaction.followup.send(embed=embed, view=MusicControlView(interaction.guild_id))
             queue.now_playing_message = msg
@@ -738,6 +3466,10 @@ async def play_slash(interaction: discord.Interaction, query: str):
         embed = create_embed("Error", f"Failed to play: {str(e)}", 0xf44336)
         await interaction.followup.send(embed=embed)
 
+@play_slash.autocomplete('query')
+async def play_query_autocomplete(interaction: discord.Interaction, current: str):
+    return play_suggestions(current, interaction.guild_id)
+
 @bot.tree.command(name="playnext", description="Add a song to play next")
 @app_commands.describe(query="Song name or YouTube URL")
 async def playnext_slash(interaction: discord.Interaction, query: str):
@@ -752,19 +3484,10 @@ async def playnext_slash(interaction: discord.Interaction, query: str):
         await interaction.user.voice.channel.connect()
     
     try:
-        if not query.startswith('http'):
-            query = f'ytsearch:{query}'
-        
         queue = get_queue(interaction.guild_id)
         queue.text_channel = interaction.channel
-        player = await YTDLSource.from_url(
-            query,
-            loop=bot.loop,
-            stream=True,
-            requester=interaction.user,
-            audio_filter=queue.audio_filter
-        )
-        player.volume = queue.volume / 100
+        data = await fetch_track_data(query, guild_id=interaction.guild_id, metadata_only=True)
+        player = QueuedTrack.from_data(data, requester=interaction.user)
         
         queue.add_next(player)
         embed = create_music_embed(player, "Added to Queue", queue)
@@ -780,43 +3503,28 @@ async def search_slash(interaction: discord.Interaction, query: str):
     await interaction.response.defer()
     
     try:
-        search_query = f'ytsearch10:{query}'
-        data = await bot.loop.run_in_executor(None, lambda: ytdl.extract_info(search_query, download=False))
+        results = (await search_tracks(query, guild_id=interaction.guild_id))[:10]
         
-        if 'entries' not in data or not data['entries']:
+        if not results:
             embed = create_embed("No Results", "No videos found!", 0xf44336)
             await interaction.followup.send(embed=embed)
             return
         
-        results = []
         embed = discord.Embed(
             title="Search Results",
             description=f"**Query:** `{query}`\n\nSelect a song from the dropdown below:",
             color=0x9b59b6
         )
         
-        for i, entry in enumerate(data['entries'][:10], 1):
-            if not entry:
-                continue
-            duration = time.strftime('%M:%S', time.gmtime(entry.get('duration', 0))) if entry.get('duration') else "Live"
-            title = entry.get('title', 'Unknown')
-            uploader = entry.get('uploader', 'Unknown')
-            views = entry.get('view_count', 0)
+        for i, result in enumerate(results, 1):
+            duration = time.strftime('%M:%S', time.gmtime(result['duration'])) if result['duration'] else "Live"
+            title = result['title']
             
             embed.add_field(
                 name=f"`{i}.` {title[:55]}{'...' if len(title) > 55 else ''}",
-                value=f"`{duration}` - `{uploader}` - `{views:,} views`",
+                value=f"`{duration}` - `{result['uploader']}` - `{result['views']:,} views`",
                 inline=False
             )
-            
-            results.append({
-                'title': title,
-                'url': entry.get('webpage_url'),
-                'duration': entry.get('duration'),
-                'thumbnail': entry.get('thumbnail'),
-                'uploader': uploader,
-                'views': views
-            })
         
         embed.set_footer(text="Select from dropdown - Expires in 2 minutes")
         await interaction.followup.send(embed=embed, view=SearchView(results, interaction.user.id))
@@ -915,16 +3623,10 @@ async def replay_slash(interaction: discord.Interaction):
     await interaction.response.defer()
     
     try:
-        new_source = await queue.current.recreate()
-        new_source.requester = queue.current.requester
-        new_source.volume = queue.volume / 100
-        
-        interaction.guild.voice_client.stop()
-        
-        interaction.guild.voice_client.play(
-            new_source,
-            after=lambda e: asyncio.run_coroutine_threadsafe(play_next(interaction.guild_id), bot.loop)
-        )
+        if interaction.guild.voice_client.source:
+            await restart_current(interaction.guild, start_at=0)
+        else:
+            await play_track(interaction.guild, queue.current)
         
         embed = create_embed("Replaying", f"Restarted **{queue.current.title}**", 0x4caf50)
         await interaction.followup.send(embed=embed)
@@ -940,15 +3642,7 @@ async def previous_slash(interaction: discord.Interaction):
     if prev_song and interaction.guild.voice_client:
         await interaction.response.defer()
         try:
-            interaction.guild.voice_client.stop()
-            new_source = await prev_song.recreate()
-            new_source.requester = prev_song.requester
-            new_source.volume = queue.volume / 100
-            
-            interaction.guild.voice_client.play(
-                new_source,
-                after=lambda e: asyncio.run_coroutine_threadsafe(play_next(interaction.guild_id), bot.loop)
-            )
+            await play_track(interaction.guild, prev_song)
             
             embed = create_music_embed(prev_song, "Playing Previous", queue)
             msg = await interaction.followup.send(embed=embed, view=MusicControlView(interaction.guild_id))
@@ -992,11 +3686,17 @@ async def queue_slash(interaction: discord.Interaction, page: int = 1):
     
     if not queue.is_empty():
         queue_text = ""
-        for i, song in enumerate(list(queue.queue)[start:end], start + 1):
+        for i, song in enumerate(queue.page(start, end), start + 1):
             duration = song.format_duration()
             queue_text += f"`{i}.` **{song.title[:45]}{'...' if len(song.title) > 45 else ''}**\n"
             queue_text += f"    `{duration}` - {song.requester.mention if song.requester else 'Unknown'}\n"
         embed.add_field(name="Up Next", value=queue_text or "Empty", inline=False)
+        
+        if queue.shuffle_enabled:
+            shuffle_text = ""
+            for song in queue.upcoming(5):
+                shuffle_text += f"`{queue.queue.index(song) + 1}.` {song.title[:45]}{'...' if len(song.title) > 45 else ''}\n"
+            embed.add_field(name="Shuffle Order", value=shuffle_text or "Empty", inline=False)
     
     total_duration = format_queue_duration(queue.total_duration())
     loop_icons = {'off': 'Off', 'song': 'Song', 'queue': 'Queue'}
@@ -1032,9 +3732,7 @@ async def clear_slash(interaction: discord.Interaction):
         return
         
     queue = get_queue(interaction.guild_id)
-    cleared = len(queue.queue)
-    queue.queue.clear()
-    queue.original_queue.clear()
+    cleared = queue.clear_upcoming()
     embed = create_embed("Queue Cleared", f"Removed **{cleared}** songs!", 0x4caf50)
     await interaction.response.send_message(embed=embed)
 
@@ -1064,6 +3762,70 @@ async def move_slash(interaction: discord.Interaction, from_pos: int, to_pos: in
         embed = create_embed("Invalid Position", "Invalid positions!", 0xf44336)
         await interaction.response.send_message(embed=embed, ephemeral=True)
 
+@bot.tree.command(name="removerange", description="Remove a range of songs from queue")
+@app_commands.describe(start="First position to remove", end="Last position to remove")
+async def removerange_slash(interaction: discord.Interaction, start: int, end: int):
+    if not await dj_check(interaction):
+        return
+    
+    queue = get_queue(interaction.guild_id)
+    
+    if start < 1 or end < start or start > len(queue.queue):
+        embed = create_embed("Invalid Range", f"Range must be within 1-{len(queue.queue)}!", 0xf44336)
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+        return
+    
+    removed = queue.remove_range(start - 1, end - 1)
+    embed = create_embed("Removed", f"Removed **{removed}** songs from #{start} to #{min(end, start + removed - 1)}", 0x4caf50)
+    await interaction.response.send_message(embed=embed)
+
+@bot.tree.command(name="removeuser", description="Remove every song a user queued")
+@app_commands.describe(user="User whose songs to remove")
+async def removeuser_slash(interaction: discord.Interaction, user: discord.Member):
+    if not await dj_check(interaction):
+        return
+    
+    queue = get_queue(interaction.guild_id)
+    removed = queue.remove_by_requester(user.id)
+    embed = create_embed("Removed", f"Removed **{removed}** songs queued by {user.mention}", 0x4caf50)
+    await interaction.response.send_message(embed=embed)
+
+@bot.tree.command(name="dedupe", description="Remove duplicate songs from queue")
+async def dedupe_slash(interaction: discord.Interaction):
+    if not await dj_check(interaction):
+        return
+    
+    queue = get_queue(interaction.guild_id)
+    removed = queue.dedupe()
+    embed = create_embed("Deduplicated", f"Removed **{removed}** duplicate songs", 0x4caf50)
+    await interaction.response.send_message(embed=embed)
+
+@bot.tree.command(name="removelong", description="Remove songs longer than a number of minutes")
+@app_commands.describe(minutes="Maximum song length in minutes")
+async def removelong_slash(interaction: discord.Interaction, minutes: int):
+    if not await dj_check(interaction):
+        return
+    
+    if minutes < 1:
+        embed = create_embed("Invalid", "Minutes must be at least 1!", 0xf44336)
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+        return
+    
+    queue = get_queue(interaction.guild_id)
+    removed = queue.remove_longer_than(minutes * 60)
+    embed = create_embed("Removed", f"Removed **{removed}** songs longer than {minutes} minutes", 0x4caf50)
+    await interaction.response.send_message(embed=embed)
+
+@bot.tree.command(name="reverse", description="Reverse the queue order")
+async def reverse_slash(interaction: discord.Interaction):
+    if not await dj_check(interaction):
+        return
+    
+    queue = get_queue(interaction.guild_id)
+    queue.reverse()
+    embed = create_embed("Queue Reversed", f"Reversed **{len(queue.queue)}** songs", 0x4caf50)
+    await interaction.response.send_message(embed=embed)
+
 @bot.tree.command(name="skipto", description="Skip to a specific song in queue")
 @app_commands.describe(position="Song position to skip to")
 async def skipto_slash(interaction: discord.Interaction, position: int):
@@ -1107,16 +3869,62 @@ async def volume_slash(interaction: discord.Interaction, level: int):
     queue = get_queue(interaction.guild_id)
     queue.volume = level
     
-    if interaction.guild.voice_client.source:
-        interaction.guild.voice_client.source.volume = level / 100
-    
     filled = int(level / 200 * 10)
     bar = "█" * filled + "░" * (10 - filled)
     
     embed = create_embed("Volume Updated", f"Volume: **{level}%**\n`{bar}`", 0x4caf50)
     await interaction.response.send_message(embed=embed)
+    await apply_volume(interaction.guild)
     await update_now_playing(interaction.guild_id)
 
+@bot.tree.command(name="normalize", description="Toggle loudness normalization")
+async def normalize_slash(interaction: discord.Interaction):
+    if not await dj_check(interaction):
+        return
+    
+    queue = get_queue(interaction.guild_id)
+    queue.normalize = not queue.normalize
+    if queue.normalize and queue.current:
+        analyze_loudness(queue, queue.current)
+    
+    status = "Enabled" if queue.normalize else "Disabled"
+    description = (
+        f"Songs are levelled to **{LOUDNESS_TARGET:g} LUFS** once they have been measured"
+        if queue.normalize else "Songs play at their original loudness"
+    )
+    embed = create_embed(f"Normalization {status}", description, 0x9b59b6)
+    await interaction.response.send_message(embed=embed)
+
+@bot.tree.command(name="gapless", description="Toggle gapless playback with optional crossfade")
+@app_commands.describe(enabled="Start the next song without a gap", crossfade=f"Crossfade length in seconds (0-{CROSSFADE_MAX})")
+async def gapless_slash(interaction: discord.Interaction, enabled: bool, crossfade: int = 0):
+    if not await dj_check(interaction):
+        return
+    
+    if not 0 <= crossfade <= CROSSFADE_MAX:
+        embed = create_embed("Invalid", f"Crossfade must be 0-{CROSSFADE_MAX} seconds!", 0xf44336)
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+        return
+    
+    queue = get_queue(interaction.guild_id)
+    queue.gapless = enabled
+    queue.crossfade = crossfade if enabled else 0
+    if queue.transition is not None:
+        queue.transition.crossfade = queue.crossfade
+    queue.refresh_prefetch()
+    
+    if not enabled:
+        description = "Songs start after the previous one ends"
+    elif crossfade:
+        description = f"Songs crossfade over **{crossfade}s**"
+    else:
+        description = "Songs follow each other without a gap"
+    if enabled and queue.transition is None and queue.current:
+        description += "\nApplies from the next song"
+    
+    embed = create_embed(f"Gapless {'Enabled' if enabled else 'Disabled'}", description, 0x9b59b6)
+    await interaction.response.send_message(embed=embed)
+
 @bot.tree.command(name="loop", description="Set loop mode")
 @app_commands.describe(mode="Loop mode")
 @app_commands.choices(mode=[
@@ -1130,12 +3938,12 @@ async def loop_slash(interaction: discord.Interaction, mode: app_commands.Choice
     queue.loop_mode = mode.value
     
     if mode.value == 'queue' and old_mode != 'queue':
-        queue.original_queue = deque(queue.queue)
-        if queue.current:
-            queue.original_queue.appendleft(queue.current)
+        queue.start_queue_loop()
     
     if mode.value != 'queue' and old_mode == 'queue':
-        queue.original_queue.clear()
+        queue.stop_queue_loop()
+    
+    queue.refresh_prefetch()
     
     descriptions = {
         'off': 'Songs play normally without repeating',
@@ -1148,12 +3956,18 @@ async def loop_slash(interaction: discord.Interaction, mode: app_commands.Choice
     await update_now_playing(interaction.guild_id)
 
 @bot.tree.command(name="shuffle", description="Toggle shuffle mode")
-async def shuffle_slash(interaction: discord.Interaction):
+@app_commands.describe(seed="Seed for a repeatable shuffle order (turns shuffle on)")
+async def shuffle_slash(interaction: discord.Interaction, seed: int = None):
     queue = get_queue(interaction.guild_id)
-    queue.shuffle_enabled = not queue.shuffle_enabled
+    if seed is None:
+        queue.toggle_shuffle()
+    else:
+        queue.set_shuffle(True, seed)
     
     status = "Enabled" if queue.shuffle_enabled else "Disabled"
     description = "Songs will play in random order" if queue.shuffle_enabled else "Songs play in queue order"
+    if seed is not None:
+        description += f" (seed `{seed}`)"
     
     embed = create_embed(f"Shuffle {status}", description, 0x9b59b6)
     await interaction.response.send_message(embed=embed)
@@ -1181,23 +3995,11 @@ async def filter_slash(interaction: discord.Interaction, effect: app_commands.Ch
     queue = get_queue(interaction.guild_id)
     queue.audio_filter = effect.value
     
-    if queue.current and interaction.guild.voice_client and interaction.guild.voice_client.is_playing():
+    if queue.current and interaction.guild.voice_client and interaction.guild.voice_client.source:
         await interaction.response.defer()
         
         try:
-            current_song = queue.current
-            new_source = await current_song.recreate(audio_filter=effect.value)
-            new_source.requester = current_song.requester
-            new_source.volume = queue.volume / 100
-            
-            interaction.guild.voice_client.stop()
-            
-            interaction.guild.voice_client.play(
-                new_source,
-                after=lambda e: asyncio.run_coroutine_threadsafe(play_next(interaction.guild_id), bot.loop)
-            )
-            
-            queue.current = new_source
+            await restart_current(interaction.guild)
             
             embed = create_embed(
                 f"Filter Applied: {effect.name}",
@@ -1217,6 +4019,65 @@ async def filter_slash(interaction: discord.Interaction, effect: app_commands.Ch
         )
         await interaction.response.send_message(embed=embed)
 
+@bot.tree.command(name="effect", description="Stack in-process audio effects (applied instantly)")
+@app_commands.describe(action="Add, remove or clear effects", effect="Effect to add or remove")
+@app_commands.choices(
+    action=[
+        app_commands.Choice(name="Add", value="add"),
+        app_commands.Choice(name="Remove", value="remove"),
+        app_commands.Choice(name="Clear all", value="clear")
+    ],
+    effect=[
+        app_commands.Choice(name="Bass - Low shelf +10dB", value="bass"),
+        app_commands.Choice(name="Super Bass - Low shelf +20dB", value="superbass"),
+        app_commands.Choice(name="Treble - High shelf +5dB", value="treble"),
+        app_commands.Choice(name="Boost - +6dB gain", value="boost"),
+        app_commands.Choice(name="Quiet - -6dB gain", value="quiet"),
+        app_commands.Choice(name="8D Audio - Pulsator", value="8d"),
+        app_commands.Choice(name="Karaoke - Mid/side vocal cut", value="karaoke")
+    ]
+)
+async def effect_slash(interaction: discord.Interaction, action: app_commands.Choice[str], effect: app_commands.Choice[str] = None):
+    if np is None:
+        embed = create_embed("Unavailable", "In-process effects need NumPy installed!", 0xf44336)
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+        return
+    
+    if action.value != 'clear' and effect is None:
+        embed = create_embed("Missing Effect", "Pick an effect to add or remove!", 0xf44336)
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+        return
+    
+    queue = get_queue(interaction.guild_id)
+    if action.value == 'clear':
+        queue.effects = ()
+    elif action.value == 'add':
+        if effect.value not in queue.effects:
+            queue.effects += (effect.value,)
+    else:
+        queue.effects = tuple(name for name in queue.effects if name != effect.value)
+    
+    # PCM sources pick the change up on their next frame; Opus ones have to be rebuilt as PCM
+    vc = interaction.guild.voice_client
+    source = vc.source if vc else None
+    if queue.effects and isinstance(source, (YTDLOpusSource, CachedOpusSource)):
+        await interaction.response.defer()
+        try:
+            await restart_current(interaction.guild)
+        except Exception as e:
+            embed = create_embed("Error", f"Failed to apply effects: {str(e)}", 0xf44336)
+            await interaction.followup.send(embed=embed)
+            return
+        respond = interaction.followup.send
+    else:
+        if getattr(source, 'recorder', None) is not None:
+            source.recorder.abort()
+        respond = interaction.response.send_message
+    
+    active = ', '.join(name.upper() for name in queue.effects) or 'None'
+    embed = create_embed("Effects Updated", f"Active effects: **{active}**", 0x9b59b6)
+    await respond(embed=embed)
+
 @bot.tree.command(name="bassboost", description="Toggle bass boost on/off")
 async def bassboost_slash(interaction: discord.Interaction):
     queue = get_queue(interaction.guild_id)
@@ -1228,22 +4089,11 @@ async def bassboost_slash(interaction: discord.Interaction):
         queue.audio_filter = 'bassboost'
         status = "Enabled"
     
-    if queue.current and interaction.guild.voice_client and interaction.guild.voice_client.is_playing():
+    if queue.current and interaction.guild.voice_client and interaction.guild.voice_client.source:
         await interaction.response.defer()
         
         try:
-            new_source = await queue.current.recreate(audio_filter=queue.audio_filter)
-            new_source.requester = queue.current.requester
-            new_source.volume = queue.volume / 100
-            
-            interaction.guild.voice_client.stop()
-            
-            interaction.guild.voice_client.play(
-                new_source,
-                after=lambda e: asyncio.run_coroutine_threadsafe(play_next(interaction.guild_id), bot.loop)
-            )
-            
-            queue.current = new_source
+            await restart_current(interaction.guild)
             
             embed = create_embed(f"Bass Boost {status}", "Effect applied to current song!", 0x9b59b6)
             await interaction.followup.send(embed=embed)
@@ -1266,22 +4116,11 @@ async def nightcore_slash(interaction: discord.Interaction):
         queue.audio_filter = 'nightcore'
         status = "Enabled"
     
-    if queue.current and interaction.guild.voice_client and interaction.guild.voice_client.is_playing():
+    if queue.current and interaction.guild.voice_client and interaction.guild.voice_client.source:
         await interaction.response.defer()
         
         try:
-            new_source = await queue.current.recreate(audio_filter=queue.audio_filter)
-            new_source.requester = queue.current.requester
-            new_source.volume = queue.volume / 100
-            
-            interaction.guild.voice_client.stop()
-            
-            interaction.guild.voice_client.play(
-                new_source,
-                after=lambda e: asyncio.run_coroutine_threadsafe(play_next(interaction.guild_id), bot.loop)
-            )
-            
-            queue.current = new_source
+            await restart_current(interaction.guild)
             
             embed = create_embed(f"Nightcore {status}", "Effect applied!", 0x9b59b6)
             await interaction.followup.send(embed=embed)
@@ -1337,6 +4176,7 @@ async def mode247_slash(interaction: discord.Interaction):
     
     guild_id = interaction.guild_id
     mode_247[guild_id] = not mode_247.get(guild_id, False)
+    metadata_store.save_guild_settings(guild_id)
     
     if mode_247[guild_id]:
         embed = create_embed("24/7 Mode Enabled", "Bot will stay in voice channel permanently!", 0x4caf50)
@@ -1445,6 +4285,8 @@ async def setdj_slash(interaction: discord.Interaction, role: discord.Role = Non
             del dj_roles[interaction.guild_id]
         embed = create_embed("DJ Role Removed", "Anyone can now control music!", 0xff9800)
     
+    metadata_store.save_guild_settings(interaction.guild_id)
+    
     await interaction.response.send_message(embed=embed)
 
 @bot.tree.command(name="playlist", description="Play a YouTube playlist")
@@ -1461,9 +4303,9 @@ async def playlist_slash(interaction: discord.Interaction, url: str):
         await interaction.user.voice.channel.connect()
     
     try:
-        data = await bot.loop.run_in_executor(None, lambda: ytdl.extract_info(url, download=False))
+        loader = PlaylistLoader(url, guild_id=interaction.guild_id)
         
-        if 'entries' not in data:
+        if not await loader.open():
             embed = create_embed("Error", "Invalid playlist URL!", 0xf44336)
             await interaction.followup.send(embed=embed)
             return
@@ -1473,39 +4315,40 @@ async def playlist_slash(interaction: discord.Interaction, url: str):
         added_count = 0
         first_song = None
         
-        embed = create_embed("Loading Playlist", f"**{data.get('title', 'Playlist')}**\n\nAdding songs...", 0x9b59b6)
+        embed = create_embed("Loading Playlist", f"**{loader.title}**\n\nAdding songs...", 0x9b59b6)
         msg = await interaction.followup.send(embed=embed)
+        last_progress = time.monotonic()
         
-        for entry in data['entries'][:100]:
-            if entry:
+        async for batch in loader.batches():
+            tracks = [QueuedTrack.from_data(entry, requester=interaction.user) for entry in batch]
+            vc = interaction.guild.voice_client
+            
+            while tracks and not first_song and not vc.is_playing() and not vc.is_paused():
+                player = tracks.pop(0)
                 try:
-                    player = await YTDLSource.from_url(
-                        entry['webpage_url'],
-                        loop=bot.loop,
-                        stream=True,
-                        requester=interaction.user,
-                        audio_filter=queue.audio_filter
-                    )
-                    player.volume = queue.volume / 100
-                    
-                    if not first_song and not interaction.guild.voice_client.is_playing():
-                        first_song = player
-                        queue.current = player
-                        interaction.guild.voice_client.play(
-                            player,
-                            after=lambda e: asyncio.run_coroutine_threadsafe(play_next(interaction.guild_id), bot.loop)
-                        )
-                        bot_stats['songs_played'] += 1
-                    else:
-                        queue.add(player)
-                    
+                    queue.current = player
+                    await play_track(interaction.guild, player)
+                    first_song = player
                     added_count += 1
-                except:
-                    continue
+                except Exception as e:
+                    logger.warning(f"Skipping unplayable playlist entry {player.webpage_url}: {e}")
+                    queue.current = None
+            
+            queue.add_playlist(tracks)
+            added_count += len(tracks)
+            
+            if time.monotonic() - last_progress >= PLAYLIST_PROGRESS_INTERVAL:
+                last_progress = time.monotonic()
+                embed = create_embed(
+                    "Loading Playlist",
+                    f"**{loader.title}**\n\nAdded **{added_count}** songs so far...",
+                    0x9b59b6
+                )
+                await msg.edit(embed=embed)
         
         embed = create_embed(
             "Playlist Added",
-            f"**{data.get('title', 'Playlist')}**\n\nAdded **{added_count}** songs to the queue!",
+            f"**{loader.title}**\n\nAdded **{added_count}** songs to the queue!",
             0x4caf50
         )
         await msg.edit(embed=embed)
@@ -1541,9 +4384,70 @@ async def stats_slash(interaction: discord.Interaction):
     embed.add_field(name="Songs Played", value=f"`{bot_stats['songs_played']:,}`", inline=True)
     embed.add_field(name="Commands Used", value=f"`{bot_stats['commands_used']:,}`", inline=True)
     embed.add_field(name="Servers", value=f"`{len(bot.guilds):,}`", inline=True)
-    embed.add_field(name="Users", value=f"`{len(set(bot.get_all_members())):,}`", inline=True)
+    embed.add_field(name="Users", value=f"`~{user_count():,}`", inline=True)
     embed.add_field(name="Voice Connections", value=f"`{len(bot.voice_clients)}`", inline=True)
     embed.add_field(name="Latency", value=f"`{round(bot.latency * 1000)}ms`", inline=True)
+    if SHARDED:
+        lines = []
+        for shard_id, latency in sorted(bot.latencies):
+            guilds = sum(1 for guild in bot.guilds if guild.shard_id == shard_id)
+            voice = sum(1 for vc in bot.voice_clients if vc.guild.shard_id == shard_id)
+            lines.append(
+                f"`#{shard_id}` `{round(latency * 1000)}ms` | `{guilds}` servers | "
+                f"`{voice}` voice | `{len(music_queues.shard(shard_id))}` queues"
+            )
+        embed.add_field(name=f"Shards ({bot.shard_count})", value="\n".join(lines)[:1024] or "`starting`", inline=False)
+    embed.add_field(
+        name="Stream Cache",
+        value=(
+            f"`{len(stream_cache)}` cached | `{stream_cache.hit_rate():.0%}` hits "
+            f"({stream_cache.hits}/{stream_cache.hits + stream_cache.misses}) | `{stream_cache.refreshed}` refreshed"
+        ),
+        inline=False
+    )
+    embed.add_field(
+        name="Search Cache",
+        value=f"`{len(search_cache)}` queries | `{search_cache.hits}` hits / `{search_cache.misses}` misses",
+        inline=False
+    )
+    embed.add_field(
+        name="Audio Cache",
+        value=f"`{len(audio_cache)}` files | `{audio_cache.size / 1048576:.0f}/{audio_cache.max_bytes // 1048576}` MB | `{audio_cache.hits}` local plays",
+        inline=False
+    )
+    embed.add_field(
+        name="Frame Cache",
+        value=f"`{len(frame_cache)}` clips | `{frame_cache.size / 1048576:.1f}/{frame_cache.total_budget // 1048576}` MB | `{frame_cache.hits}` replays",
+        inline=False
+    )
+    embed.add_field(
+        name="Loudness",
+        value=f"`{loudness.analyzed}` analyzed | `{loudness.running()}` running | `{loudness.failed}` failed",
+        inline=False
+    )
+    embed.add_field(
+        name="Queues",
+        value=(
+            f"`{len(music_queues)}` live | `{queue_registry.evicted}` evicted | "
+            f"`{len(queue_registry.spilled)}` spilled | `{queue_registry.restored}` restored"
+        ),
+        inline=False
+    )
+    embed.add_field(
+        name="Now Playing Edits",
+        value=f"`{now_playing_updater.edits}` sent | `{now_playing_updater.skipped}` unchanged skipped",
+        inline=False
+    )
+    wait_avg, wait_max = extractor.wait_times()
+    embed.add_field(
+        name="Extraction",
+        value=(
+            f"`{extractor.busy_workers()}/{extractor.workers}` busy | `{extractor.queue_depth()}` queued | "
+            f"wait `{wait_avg:.0f}ms` avg, `{wait_max:.0f}ms` max\n"
+            f"Coalesced: `{extractor.coalesced}` callers (max `{extractor.max_callers}` per flight)"
+        ),
+        inline=False
+    )
     
     try:
         import psutil
@@ -1585,6 +4489,11 @@ async def help_slash(interaction: discord.Interaction):
         "`/clear` - Clear queue\n"
         "`/remove` - Remove song\n"
         "`/move` - Move song position\n"
+        "`/removerange` - Remove a range\n"
+        "`/removeuser` - Remove a user's songs\n"
+        "`/dedupe` - Remove duplicates\n"
+        "`/removelong` - Remove long songs\n"
+        "`/reverse` - Reverse queue\n"
         "`/skipto` - Skip to position\n"
         "`/playlist` - Play YouTube playlist"
     )
@@ -1592,13 +4501,16 @@ async def help_slash(interaction: discord.Interaction):
     settings = (
         "`/volume` - Adjust volume (0-200%)\n"
         "`/loop` - Loop mode (off/song/queue)\n"
-        "`/shuffle` - Toggle shuffle"
+        "`/shuffle` - Toggle shuffle\n"
+        "`/gapless` - Gapless & crossfade\n"
+        "`/normalize` - Level song loudness"
     )
     
     filters = (
         "`/filter` - Apply audio effect\n"
         "`/bassboost` - Toggle bass boost\n"
         "`/nightcore` - Toggle nightcore\n"
+        "`/effect` - Stack live effects\n"
         "*Effects: Normal, Bass, Super Bass,*\n"
         "*Nightcore, Vaporwave, Treble, 8D,*\n"
         "*Karaoke, Soft, Loud*"
@@ -1638,7 +4550,12 @@ async def help_slash(interaction: discord.Interaction):
 
 @bot.tree.command(name="ping", description="Check bot latency")
 async def ping_slash(interaction: discord.Interaction):
-    latency = round(bot.latency * 1000)
+    latency = bot.latency
+    if SHARDED and interaction.guild:
+        shard = bot.get_shard(interaction.guild.shard_id)
+        if shard:
+            latency = shard.latency
+    latency = round(latency * 1000)
     
     if latency < 100:
         status = "Excellent"
@@ -1686,9 +4603,6 @@ async def on_app_command_error(interaction: discord.Interaction, error: app_comm
 # ═══════════════════════════════════════════════════════════════════════════════
 
 if __name__ == "__main__":
-    from dotenv import load_dotenv
-    load_dotenv()
-    
     TOKEN = os.getenv('DISCORD_BOT_TOKEN')
     
     if not TOKEN: